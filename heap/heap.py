@@ -1,13 +1,153 @@
-iparent = lambda i: int(i / 2)
-ileft = lambda i: i * 2
-iright = lambda i: i * 2 + 1
+import operator
+
+ARITY = 4  # children per node, 4 keeps the tree shallow at one cache line
+
+
+# 1-based d-ary layout: children of i are d*(i - 1) + 2 ... d*i + 1
+def iparent(i, d=2):
+    return (i - 2) // d + 1
+
+
+def ileft(i, d=2):
+    return d * (i - 1) + 2
+
+
+def iright(i, d=2):
+    return d * i + 1
+
+
+# sift engine, one variant per heap type so no comparison goes through a
+# callback; the moving element is held in a hole and written once at the end
+def sift_down_max(A, i, length, d):
+    item = A[i]
+    while True:
+        first = d * (i - 1) + 2
+        if first >= length:
+            break
+        c, best = first, A[first]
+        for j in xrange(first + 1, min(first + d, length)):
+            if A[j] > best:
+                c, best = j, A[j]
+        if not best > item:
+            break
+        A[i] = best
+        i = c
+    A[i] = item
+
+
+def sift_down_min(A, i, length, d):
+    item = A[i]
+    while True:
+        first = d * (i - 1) + 2
+        if first >= length:
+            break
+        c, best = first, A[first]
+        for j in xrange(first + 1, min(first + d, length)):
+            if A[j] < best:
+                c, best = j, A[j]
+        if not best < item:
+            break
+        A[i] = best
+        i = c
+    A[i] = item
+
+
+def sift_up_max(A, i, d):
+    item = A[i]
+    while i > 1:
+        p = (i - 2) // d + 1
+        parent = A[p]
+        if not item > parent:
+            break
+        A[i] = parent
+        i = p
+    A[i] = item
+
+
+def sift_up_min(A, i, d):
+    item = A[i]
+    while i > 1:
+        p = (i - 2) // d + 1
+        parent = A[p]
+        if not item < parent:
+            break
+        A[i] = parent
+        i = p
+    A[i] = item
+
+
+# bottom-up variant of sift down: the hole goes down to a leaf along the
+# best children, d - 1 compares per level and none against the element,
+# then the element climbs back from the leaf; a popped heap tail is small,
+# so it rarely climbs far and about half the compares are saved for d = 2
+def sift_floyd_max(A, i, length, d):
+    item = A[i]
+    start = i
+    while True:
+        first = d * (i - 1) + 2
+        if first >= length:
+            break
+        c, best = first, A[first]
+        for j in xrange(first + 1, min(first + d, length)):
+            if A[j] > best:
+                c, best = j, A[j]
+        A[i] = best
+        i = c
+    while i > start:
+        p = (i - 2) // d + 1
+        parent = A[p]
+        if not item > parent:
+            break
+        A[i] = parent
+        i = p
+    A[i] = item
+
+
+def sift_floyd_min(A, i, length, d):
+    item = A[i]
+    start = i
+    while True:
+        first = d * (i - 1) + 2
+        if first >= length:
+            break
+        c, best = first, A[first]
+        for j in xrange(first + 1, min(first + d, length)):
+            if A[j] < best:
+                c, best = j, A[j]
+        A[i] = best
+        i = c
+    while i > start:
+        p = (i - 2) // d + 1
+        parent = A[p]
+        if not item < parent:
+            break
+        A[i] = parent
+        i = p
+    A[i] = item
+
+
+SIFTS = {
+    'max': (sift_down_max, sift_up_max, sift_floyd_max),
+    'min': (sift_down_min, sift_up_min, sift_floyd_min),
+}
 
 
 class Heap(object):
-    def __init__(self, array=[], htype='max'):
+    def __init__(self, array=[], htype='max', arity=ARITY):
+        '''
+        paras:
+            htype -- 'max' or 'min', fixed for the life of the heap
+            arity -- children per node, 2 is the classic binary heap
+        '''
+        if arity < 2:
+            raise ValueError('arity must bigger than 1')
+        self.htype = 'max' if htype == 'max' else 'min'
+        self.arity = arity
+        self.sift_down, self.sift_up, self.sift_floyd = SIFTS[self.htype]
         # self.cmp is a wrapper to compare relationship between parent and
         # child node, if True, satisfied; False othrewise.
-        if htype == 'max':
+        # only sanity checks use it, sifts compare inline
+        if self.htype == 'max':
             self.cmp = lambda x, y: x >= y
         else:
             self.cmp = lambda x, y: x <= y
@@ -17,10 +157,10 @@ class Heap(object):
         ''' test heap is valid '''
         # Heap is such data struct that
         # can be a tree too, but a list can save more space
-        # 1. a list that can be seen as complete binary tree, root node is [0]
+        # 1. a list that can be seen as complete d-ary tree, root node is [1]
         # 2. parent and child can be indexed as above
         # 3. node must >= its child (max heap), or otherwise (min heap)
-        # example:
+        # example, arity 2:
         #                    200[1]
         #                    /  \
         #                  17[2] 50[3]
@@ -29,71 +169,86 @@ class Heap(object):
         #           /   \
         #         9[8]  7[9]
         heap = self.heap
-        length = len(self.heap)
-        i = 1
-        level = 0
-
-        def check_child(i):
-            l, r = ileft(i), iright(i)
-            if l < length:
-                assert self.cmp(heap[i], heap[l]), '%s i:%d l:%d' % (heap, i, l)
-            if r < length:
-                assert self.cmp(heap[i], heap[r]), '%s i:%d r:%d' % (heap, i, r)
-
-        while i < length:
-            nnode = 2 ** level  # num of node in this tree level
-            for delta in range(0, nnode):
-                # traverse node in level of tree
-                index = i + delta
-                if index < length:  # make sure not cross boundary of list
-                    check_child(index)
-                else:
-                    break
-            # prepare for next loop
-            i += nnode
-            level += 1
-
-    def heapify(self, i):
-        # topdown traverse
-        A = self.heap
-        length = len(A)
-        l, r = ileft(i), iright(i)  # left and right child index
+        d = self.arity
+        for i in xrange(2, len(heap)):
+            p = iparent(i, d)
+            assert self.cmp(heap[p], heap[i]), '%s p:%d i:%d' % (heap, p, i)
+        return True
 
-        # find the largest element
-        largest = l if l < length and not self.cmp(A[i], A[l]) else i
-        largest = r if r < length and not self.cmp(A[largest], A[r]) else largest
-        if largest != i:  # heap rules fix
-            A[i], A[largest] = A[largest], A[i]
-            self.heapify(largest)
+    def heapify(self, i, length=None):
+        '''
+        sift element i down to restore the heap below it
+        length -- heap is self.heap[:length], default the whole list
+        '''
+        if length is None:
+            length = len(self.heap)
+        self.sift_down(self.heap, i, length, self.arity)
+
+    def heapify_up(self, i):
+        ''' sift element i up to restore the heap above it '''
+        self.sift_up(self.heap, i, self.arity)
 
     def create(self, array):
         ''' build heap from an array '''
         # in place build heap
         self.heap = [0] + array  # index start from 1
+        self.rebuild()
+
+    def rebuild(self):
+        ''' restore heap property of the whole list, O(n) '''
         # no need to traverse all nodes, since some are leaves
-        stop = int(len(self.heap) / 2)
-        # we use a bottom-up order to avoid too much recurse
-        for i in range(stop, 0, -1):
-            self.heapify(i)
+        stop = iparent(len(self.heap) - 1, self.arity)
+        # bottom-up, every subtree below i is a heap already
+        heapify = self.heapify
+        for i in xrange(stop, 0, -1):
+            heapify(i)
 
-    def sort(self):
-        ''' heap sort '''
-        length = len(self.heap)
-        if length <= 1:  # empty heap
-            return []
+    def sort(self, key=None, reverse=False, bottom_up=False, keep=False):
+        '''
+        heap sort, ascending for max heap and descending for min heap
+        in place: the top is swapped to the end of the backing list, which
+        becomes the result
+        T(n) = O(n*log(n)), no extra list
+        the heap is left empty, unless keep
+        paras:
+            key, reverse -- like sorted(), keys are computed once; elements
+                            are then sorted through a (key, index) heap
+            bottom_up -- sift with sift_floyd, fewer compares, for elements
+                         with expensive comparisons
+            keep -- sort a copy and keep this heap intact
+        '''
+        if key is not None or reverse:
+            items = self.heap[1:]
+            keys = items if key is None else [key(x) for x in items]
+            # index breaks ties, negated when the result comes out
+            # descending, so equal keys always keep their heap order
+            sign = -1 if (self.htype == 'min') != reverse else 1
+            pairs = Heap([(k, sign * i) for i, k in enumerate(keys)],
+                         self.htype, self.arity).sort(bottom_up=bottom_up)
+            if reverse:
+                pairs.reverse()
+            if not keep:
+                self.heap = [0]
+            return [items[sign * i] for k, i in pairs]
+        if keep:
+            heap = Heap([], self.htype, self.arity)
+            heap.heap = list(self.heap)  # already a heap, no rebuild
+            return heap.sort(bottom_up=bottom_up)
         A = self.heap
-        result = []
-        for i in range(length - 1, 1, -1):
-            # popup the root node each time, since it's max of the heap. Every
-            # time we insert this number in the result list, and put the last
-            # child of heap to root, doing a heapify to maintain heap property
-            # until the heap has only one element.
-            A[1], A[i] = A[i], A[1]
-            result.insert(0, A.pop(i))
-            self.heapify(1)
-        result.insert(0, A[1])  # only one child left, add to result
-
-        return result
+        if bottom_up:
+            sift, d = self.sift_floyd, self.arity
+            for i in xrange(len(A) - 1, 1, -1):
+                A[1], A[i] = A[i], A[1]
+                sift(A, 1, i, d)
+        else:
+            heapify = self.heapify
+            for i in xrange(len(A) - 1, 1, -1):
+                # the top goes to the front of the sorted tail A[i:]
+                A[1], A[i] = A[i], A[1]
+                heapify(1, i)
+        del A[0]  # the dummy slot, A is now the sorted result
+        self.heap = [0]
+        return A
 
 
 class PriorityQueue(Heap):
@@ -105,14 +260,75 @@ class PriorityQueue(Heap):
     def pop_top(self):
         ''' pop max or min element depends on type of tree '''
         heap = self.heap
-        end = len(heap) - 1
-        assert end > 0, 'empty heap'
-        # swap head and tail, this is like *heap sort*
-        heap[1], heap[end] = heap[end], heap[1]
-        top = heap.pop(end)
+        assert len(heap) > 1, 'empty heap'
+        last = heap.pop()
+        if len(heap) == 1:
+            return last
+        # the tail fills the hole at the root, like *heap sort*
+        top = heap[1]
+        heap[1] = last
+        self.heapify(1)
+        return top
+
+    def replace_top(self, key):
+        ''' pop the top and insert key, with only one sift down '''
+        heap = self.heap
+        assert len(heap) > 1, 'empty heap'
+        top = heap[1]
+        heap[1] = key
         self.heapify(1)
         return top
 
+    replace = replace_top
+
+    def pushpop(self, key):
+        '''
+        insert key then pop the top, with at most one sift down
+        key is returned at once when it would be the top itself
+        '''
+        heap = self.heap
+        if len(heap) == 1 or self.cmp(key, heap[1]):
+            return key
+        top = heap[1]
+        heap[1] = key
+        self.heapify(1)
+        return top
+
+    def push_many(self, keys):
+        '''
+        insert all of keys
+        a sift up is O(1) on average for random keys but O(log(n)) for
+        keys that climb to the top, a rebuild is O(n + k) whatever the keys;
+        batches over half the heap size take the rebuild
+        '''
+        heap = self.heap
+        keys = list(keys)
+        if 2 * len(keys) > len(heap) - 1:
+            heap.extend(keys)
+            self.rebuild()
+            return
+        heapify_up = self.heapify_up
+        for key in keys:
+            heap.append(key)
+            heapify_up(len(heap) - 1)
+
+    def pop_many(self, k):
+        ''' pop up to k tops, in pop order '''
+        pop_top = self.pop_top
+        return [pop_top() for i in xrange(min(k, len(self.heap) - 1))]
+
+    def merge(self, other):
+        '''
+        add all elements of heap other, other is not changed
+        concatenate then rebuild, T(n) = O(n + m)
+        '''
+        if other.htype != self.htype:
+            raise ValueError('cannot merge %s heap into %s heap' %
+                             (other.htype, self.htype))
+        self.heap.extend(other.heap[1:])
+        self.rebuild()
+        return self
+
     def update_key(self, i, key):
         ''' update rank i element to key '''
         heap = self.heap
@@ -120,12 +336,7 @@ class PriorityQueue(Heap):
         orig = heap[i]
         heap[i] = key
         if self.cmp(key, orig):  # go upwards
-            p = iparent(i)
-            # swap with parent until heap property meets or reach the top
-            while i > 1 and self.cmp(heap[i], heap[p]):
-                heap[i], heap[p] = heap[p], heap[i]
-                i = p
-                p = iparent(i)
+            self.heapify_up(i)
         else:  # downwards
             self.heapify(i)
 
@@ -133,9 +344,196 @@ class PriorityQueue(Heap):
         heap = self.heap
         heap.append(key)  # append to tail
         # that means we must go upwards if necessary
-        i = len(heap) - 1
-        p = iparent(i)
-        while i > 1 and self.cmp(heap[i], heap[p]):
-            heap[i], heap[p] = heap[p], heap[i]
+        self.heapify_up(len(heap) - 1)
+
+
+class IndexedPriorityQueue(object):
+    '''
+    priority queue of distinct hashable items, addressed by item instead of
+    heap position; every sift keeps the item -> position map in sync
+        push, update, remove, pop -- O(log(n))
+        __contains__, priority -- O(1)
+    priorities are in self.heap, same 1-based d-ary layout as Heap, and
+    their items in the parallel list self.items
+    '''
+    def __init__(self, pairs=(), htype='max', arity=ARITY):
+        '''
+        paras:
+            pairs -- (item, priority) pairs to start with, built in O(n)
+            htype -- 'max' or 'min', fixed for the life of the queue
+            arity -- children per node
+        '''
+        if arity < 2:
+            raise ValueError('arity must bigger than 1')
+        self.htype = 'max' if htype == 'max' else 'min'
+        self.arity = arity
+        # C level compare, True when the first belongs above the second
+        self.before = operator.gt if self.htype == 'max' else operator.lt
+        self.heap, self.items = [0], [None]
+        for item, prio in pairs:
+            self.items.append(item)
+            self.heap.append(prio)
+        self.pos = {}
+        for i in xrange(1, len(self.items)):
+            if self.items[i] in self.pos:
+                raise ValueError('duplicate item %r' % (self.items[i],))
+            self.pos[self.items[i]] = i
+        for i in xrange(iparent(len(self.heap) - 1, arity), 0, -1):
+            self.sift_down(i)
+
+    def __len__(self):
+        return len(self.heap) - 1
+
+    def __contains__(self, item):
+        return item in self.pos
+
+    def priority(self, item):
+        return self.heap[self.pos[item]]
+
+    def sanity(self):
+        ''' test heap property and position map are valid '''
+        heap, items, d = self.heap, self.items, self.arity
+        for i in xrange(2, len(heap)):
+            p = iparent(i, d)
+            assert not self.before(heap[i], heap[p]), \
+                '%s p:%d i:%d' % (heap, p, i)
+        assert len(self.pos) == len(heap) - 1, 'stale positions'
+        for item, i in self.pos.iteritems():
+            assert items[i] == item, 'item %r not at %d' % (item, i)
+        return True
+
+    def sift_up(self, i):
+        heap, items, pos = self.heap, self.items, self.pos
+        before, d = self.before, self.arity
+        prio, item = heap[i], items[i]
+        while i > 1:
+            p = (i - 2) // d + 1
+            if not before(prio, heap[p]):
+                break
+            heap[i] = heap[p]
+            items[i] = items[p]
+            pos[items[i]] = i
             i = p
-            p = iparent(i)
+        heap[i] = prio
+        items[i] = item
+        pos[item] = i
+        return i
+
+    def sift_down(self, i):
+        heap, items, pos = self.heap, self.items, self.pos
+        before, d = self.before, self.arity
+        length = len(heap)
+        prio, item = heap[i], items[i]
+        while True:
+            first = d * (i - 1) + 2
+            if first >= length:
+                break
+            c, best = first, heap[first]
+            for j in xrange(first + 1, min(first + d, length)):
+                if before(heap[j], best):
+                    c, best = j, heap[j]
+            if not before(best, prio):
+                break
+            heap[i] = best
+            items[i] = items[c]
+            pos[items[i]] = i
+            i = c
+        heap[i] = prio
+        items[i] = item
+        pos[item] = i
+        return i
+
+    def peek(self):
+        ''' (item, priority) of the top '''
+        assert len(self.heap) > 1, 'empty heap'
+        return self.items[1], self.heap[1]
+
+    def push(self, item, prio):
+        if item in self.pos:
+            raise ValueError('item %r already queued' % (item,))
+        self.heap.append(prio)
+        self.items.append(item)
+        self.sift_up(len(self.heap) - 1)
+
+    def update(self, item, prio):
+        ''' change priority of a queued item, KeyError if not queued '''
+        i = self.pos[item]
+        orig = self.heap[i]
+        self.heap[i] = prio
+        if self.before(prio, orig):
+            self.sift_up(i)
+        else:
+            self.sift_down(i)
+
+    def remove(self, item):
+        ''' remove a queued item, return its priority '''
+        i = self.pos.pop(item)
+        heap, items = self.heap, self.items
+        prio = heap[i]
+        last_prio, last_item = heap.pop(), items.pop()
+        if i < len(heap):  # the tail fills the hole, then goes up or down
+            heap[i], items[i] = last_prio, last_item
+            if self.before(last_prio, prio):
+                self.sift_up(i)
+            else:
+                self.sift_down(i)
+        return prio
+
+    def pop(self):
+        ''' remove the top, return (item, priority) '''
+        assert len(self.heap) > 1, 'empty heap'
+        item = self.items[1]
+        return item, self.remove(item)
+
+
+def merge_iter(*iterables, **kwargs):
+    '''
+    lazily merge sorted iterables into one sorted iterator
+    only the head element of each source is kept, so memory is O(k), and
+    every output costs one replace_top instead of a pop plus an insert
+    ties are broken by source index, so the merge is stable
+    paras:
+        key -- key function to compare elements, like sorted()
+    '''
+    key = kwargs.pop('key', None)
+    if kwargs:
+        raise TypeError('unexpected keyword arguments: %s' % kwargs.keys())
+    sources = [iter(it) for it in iterables]
+    heads = []
+    for i, source in enumerate(sources):
+        for value in source:
+            heads.append((value if key is None else key(value), i, value))
+            break
+    queue = PriorityQueue(heads, htype='min')
+    heap = queue.heap
+    while len(heap) > 1:
+        _, i, value = heap[1]
+        for value_next in sources[i]:  # advance the source of the top
+            queue.replace_top((value_next if key is None else key(value_next),
+                               i, value_next))
+            break
+        else:  # source exhausted
+            queue.pop_top()
+        yield value
+
+
+def partial_sort(array, k):
+    '''
+    k smallest elements of array in sorted order, array is not changed
+    bottom-up build of a min heap, then k pops
+    T(n) = O(n + k*log(n))
+    '''
+    queue = PriorityQueue(array, htype='min')
+    return [queue.pop_top() for i in xrange(min(k, len(array)))]
+
+
+def sorted_iter(array):
+    '''
+    iterate elements of array in ascending order, sorted on demand
+    the heap is built in O(n), then each element costs O(log(n)), so a
+    consumer stopping after k elements pays only O(n + k*log(n))
+    '''
+    queue = PriorityQueue(array, htype='min')
+    heap = queue.heap
+    while len(heap) > 1:
+        yield queue.pop_top()
@@ -0,0 +1,297 @@
+'''
+priority queues for concurrent producers and consumers, on PriorityQueue
+
+    ThreadedPriorityQueue -- for threads, blocking get/put with timeout
+    AsyncPriorityQueue -- for one asyncio event loop, get/put return
+                          futures, nothing blocks
+
+both take maxsize, 0 for unbounded; a full queue makes put wait, so slow
+consumers push back on producers. get_many(k) takes up to k items at once,
+one lock acquisition or one wakeup for the whole batch
+under the lock only O(log(n)) heap operations run, the waiting is done
+outside it by the condition variables
+on python 2 the trollius backport provides asyncio
+
+python queues.py [producers] [consumers] benchmarks throughput
+'''
+import threading
+import time
+from collections import deque
+from Queue import Empty, Full
+
+from heap import PriorityQueue, ARITY
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:  # only ThreadedPriorityQueue works without a loop
+        asyncio = None
+
+
+class ThreadedPriorityQueue(object):
+    def __init__(self, maxsize=0, htype='min', arity=ARITY):
+        '''
+        paras:
+            maxsize -- most items queued at once, 0 for no limit
+            htype -- 'min' gets the smallest item first, 'max' the largest
+        '''
+        self.maxsize = maxsize
+        self.queue = PriorityQueue([], htype, arity)
+        self.mutex = threading.Lock()
+        self.not_empty = threading.Condition(self.mutex)
+        self.not_full = threading.Condition(self.mutex)
+
+    def qsize(self):
+        with self.mutex:
+            return len(self.queue.heap) - 1
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def full(self):
+        return 0 < self.maxsize <= self.qsize()
+
+    def wait(self, cond, ready, block, timeout, exc):
+        ''' wait on cond until ready(), mutex held; raise exc when out '''
+        if not block:
+            if not ready():
+                raise exc
+        elif timeout is None:
+            while not ready():
+                cond.wait()
+        else:
+            end = time.time() + timeout
+            while not ready():
+                remaining = end - time.time()
+                if remaining <= 0:
+                    raise exc
+                cond.wait(remaining)
+
+    def put(self, item, block=True, timeout=None):
+        ''' queue item, wait for room if full; Full when out of time '''
+        heap = self.queue.heap
+        maxsize = self.maxsize
+        with self.mutex:
+            if maxsize > 0:
+                self.wait(self.not_full, lambda: len(heap) <= maxsize,
+                          block, timeout, Full)
+            self.queue.insert_key(item)
+            self.not_empty.notify()
+
+    def put_many(self, items, block=True, timeout=None):
+        '''
+        queue all of items, as much as fits per lock acquisition
+        Full when out of time, items queued before stay queued
+        '''
+        items = list(items)
+        heap = self.queue.heap
+        maxsize = self.maxsize
+        end = None if timeout is None else time.time() + timeout
+        i = 0
+        while i < len(items):
+            with self.mutex:
+                if maxsize > 0:
+                    self.wait(self.not_full, lambda: len(heap) <= maxsize,
+                              block, None if end is None else
+                              max(end - time.time(), 0), Full)
+                    room = maxsize - (len(heap) - 1)
+                else:
+                    room = len(items)
+                batch = items[i:i + room]
+                self.queue.push_many(batch)
+                i += len(batch)
+                if len(batch) == 1:
+                    self.not_empty.notify()
+                else:
+                    self.not_empty.notify_all()
+
+    def get(self, block=True, timeout=None):
+        ''' pop the top, wait for one if empty; Empty when out of time '''
+        heap = self.queue.heap
+        with self.mutex:
+            self.wait(self.not_empty, lambda: len(heap) > 1,
+                      block, timeout, Empty)
+            item = self.queue.pop_top()
+            self.not_full.notify()
+            return item
+
+    def get_many(self, k, block=True, timeout=None):
+        '''
+        pop up to k tops in one lock acquisition, waiting only for the first
+        Empty when out of time
+        '''
+        heap = self.queue.heap
+        with self.mutex:
+            self.wait(self.not_empty, lambda: len(heap) > 1,
+                      block, timeout, Empty)
+            items = self.queue.pop_many(k)
+            if len(items) == 1:
+                self.not_full.notify()
+            else:
+                self.not_full.notify_all()
+            return items
+
+    def put_nowait(self, item):
+        return self.put(item, False)
+
+    def get_nowait(self):
+        return self.get(False)
+
+
+class AsyncPriorityQueue(object):
+    '''
+    waiting getters and putters are futures in fifo order; every change of
+    the heap hands items to getters and room to putters right away, so no
+    one is woken to find nothing there
+    not thread safe, use it from the loop's thread only
+    '''
+    def __init__(self, maxsize=0, htype='min', arity=ARITY, loop=None):
+        self.maxsize = maxsize
+        self.queue = PriorityQueue([], htype, arity)
+        self.loop = loop or asyncio.get_event_loop()
+        self.getters = deque()  # (future, k), k None for a single item
+        self.putters = deque()  # (future, item)
+
+    def qsize(self):
+        return len(self.queue.heap) - 1
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def full(self):
+        return 0 < self.maxsize <= self.qsize()
+
+    def wakeup(self):
+        ''' serve waiting getters from the heap, putters with free room '''
+        queue, getters, putters = self.queue, self.getters, self.putters
+        heap = queue.heap
+        while (getters and len(heap) > 1) or (putters and not self.full()):
+            while getters and len(heap) > 1:
+                future, k = getters.popleft()
+                if future.done():  # cancelled or timed out
+                    continue
+                future.set_result(queue.pop_top() if k is None else
+                                  queue.pop_many(k))
+            while putters and not self.full():
+                future, item = putters.popleft()
+                if future.done():
+                    continue
+                queue.insert_key(item)
+                future.set_result(None)
+
+    def expire_after(self, future, timeout):
+        ''' fail future with TimeoutError unless done within timeout '''
+        if timeout is None:
+            return
+
+        def expire():
+            if not future.done():
+                future.set_exception(asyncio.TimeoutError())
+
+        handle = self.loop.call_later(timeout, expire)
+        future.add_done_callback(lambda f: handle.cancel())
+
+    def put_nowait(self, item):
+        if self.full():
+            raise asyncio.QueueFull
+        self.queue.insert_key(item)
+        self.wakeup()
+
+    def put(self, item, timeout=None):
+        '''
+        queue item, return a future resolved once it is queued
+        a full queue keeps it until a get makes room
+        '''
+        future = asyncio.Future(loop=self.loop)
+        if self.full():
+            self.putters.append((future, item))
+            self.expire_after(future, timeout)
+        else:
+            self.put_nowait(item)
+            future.set_result(None)
+        return future
+
+    def get_nowait(self):
+        if self.empty():
+            raise asyncio.QueueEmpty
+        item = self.queue.pop_top()
+        self.wakeup()
+        return item
+
+    def get(self, timeout=None):
+        ''' return a future resolved to the top, once there is one '''
+        return self.waiting_get(None, timeout)
+
+    def get_many(self, k, timeout=None):
+        ''' return a future resolved to a list of up to k tops, at least 1 '''
+        return self.waiting_get(k, timeout)
+
+    def waiting_get(self, k, timeout):
+        future = asyncio.Future(loop=self.loop)
+        if self.empty():
+            self.getters.append((future, k))
+            self.expire_after(future, timeout)
+        else:
+            queue = self.queue
+            future.set_result(queue.pop_top() if k is None else
+                              queue.pop_many(k))
+            self.wakeup()
+        return future
+
+
+def bench(producers=4, consumers=4, n=200000, batch=1, maxsize=1000):
+    '''
+    items per second through a ThreadedPriorityQueue, producers put n
+    random items in total, consumers get them batch at a time
+    '''
+    import random
+    queue = ThreadedPriorityQueue(maxsize)
+    done = threading.Event()
+    got = []
+
+    def produce(count):
+        items = [random.random() for i in xrange(count)]
+        if batch == 1:
+            for item in items:
+                queue.put(item)
+        else:
+            for i in xrange(0, count, batch):
+                queue.put_many(items[i:i + batch])
+
+    def consume():
+        count = 0
+        while not (done.is_set() and queue.empty()):
+            try:
+                if batch == 1:
+                    queue.get(timeout=0.01)
+                    count += 1
+                else:
+                    count += len(queue.get_many(batch, timeout=0.01))
+            except Empty:
+                pass
+        got.append(count)
+
+    workers = [threading.Thread(target=consume) for i in xrange(consumers)]
+    makers = [threading.Thread(target=produce, args=(n // producers,))
+              for i in xrange(producers)]
+    start = time.time()
+    for t in workers + makers:
+        t.start()
+    for t in makers:
+        t.join()
+    done.set()
+    for t in workers:
+        t.join()
+    assert sum(got) == n // producers * producers
+    return sum(got) / (time.time() - start)
+
+
+if __name__ == '__main__':
+    import sys
+    producers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    consumers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    for batch in (1, 16, 256):
+        print 'batch %4d: %10.0f items/s' % (
+            batch, bench(producers, consumers, batch=batch))
@@ -52,6 +52,259 @@ class TestHeap(unittest.TestCase):
         q.insert_key(4)
         q.sanity()
 
+    def test_arity(self):
+        from heap import PriorityQueue
+        for arity in (2, 3, 4, 8):
+            for htype in ('max', 'min'):
+                array = [random.randint(0, 50) for i in range(300)]
+                q = PriorityQueue(deepcopy(array), htype, arity)
+                self.assertTrue(q.sanity())
+                for i in range(100):
+                    q.insert_key(random.randint(-10, 60))
+                    q.update_key(random.randint(1, len(q.heap) - 1),
+                                 random.randint(-10, 60))
+                    self.assertTrue(q.sanity())
+                popped = [q.pop_top() for i in range(len(q.heap) - 1)]
+                self.assertListEqual(popped,
+                                     sorted(popped, reverse=htype == 'max'))
+        self.assertRaises(ValueError, PriorityQueue, [], 'min', 1)
+
+    def test_inplace_sort(self):
+        from heap import Heap
+
+        class Counted(object):
+            compares = [0]
+
+            def __init__(self, value):
+                self.value = value
+
+            def __lt__(self, other):
+                self.compares[0] += 1
+                return self.value < other.value
+
+            def __gt__(self, other):
+                self.compares[0] += 1
+                return self.value > other.value
+
+        array = [random.randint(0, 1000) for i in range(2000)]
+        for htype in ('max', 'min'):
+            for arity in (2, 4):
+                expect = sorted(array, reverse=htype == 'min')
+                h = Heap(deepcopy(array), htype, arity)
+                backing = h.heap
+                self.assertListEqual(h.sort(keep=True), expect)
+                self.assertTrue(h.heap is backing and h.sanity())
+                self.assertListEqual(h.sort(keep=True, bottom_up=True),
+                                     expect)
+                result = h.sort()
+                self.assertTrue(result is backing)  # sorted in place
+                self.assertListEqual(result, expect)
+                self.assertListEqual(h.heap, [0])
+                h = Heap(deepcopy(array), htype, arity)
+                self.assertListEqual(h.sort(bottom_up=True), expect)
+        self.assertListEqual(Heap([]).sort(), [])
+
+        compares = Counted.compares
+        h = Heap([Counted(x) for x in array], arity=2)
+        compares[0] = 0
+        h.sort(keep=True)
+        plain = compares[0]
+        compares[0] = 0
+        h.sort(keep=True, bottom_up=True)
+        self.assertTrue(compares[0] < 0.75 * plain)
+
+    def test_indexed_queue(self):
+        from heap import IndexedPriorityQueue
+        for htype in ('max', 'min'):
+            prios = dict(('job%d' % i, random.randint(0, 100))
+                         for i in range(300))
+            q = IndexedPriorityQueue(prios.items(), htype)
+            self.assertTrue(q.sanity())
+            for i in range(300):
+                item = 'job%d' % random.randint(0, 400)
+                prio = random.randint(-50, 150)
+                op = random.randint(0, 2)
+                if item not in prios:
+                    self.assertFalse(item in q)
+                    q.push(item, prio)
+                    prios[item] = prio
+                elif op == 0:
+                    self.assertEqual(q.remove(item), prios.pop(item))
+                else:
+                    q.update(item, prio)
+                    prios[item] = prio
+                self.assertTrue(q.sanity())
+                self.assertEqual(len(q), len(prios))
+            for item, prio in prios.items():
+                self.assertEqual(q.priority(item), prio)
+            popped = [q.pop() for i in range(len(q))]
+            self.assertListEqual(sorted(popped), sorted(prios.items()))
+            self.assertListEqual([p for _, p in popped],
+                                 sorted(prios.values(),
+                                        reverse=htype == 'max'))
+            self.assertEqual(len(q), 0)
+        self.assertRaises(ValueError, IndexedPriorityQueue, [(1, 1), (1, 2)])
+        q = IndexedPriorityQueue([('a', 1)])
+        self.assertRaises(ValueError, q.push, 'a', 2)
+        self.assertRaises(KeyError, q.update, 'b', 2)
+
+    def test_bulk(self):
+        from heap import PriorityQueue
+        for htype in ('max', 'min'):
+            array = [random.randint(0, 100) for i in range(200)]
+            for n in (10, 150, 1000):  # sifts and rebuild
+                q = PriorityQueue(deepcopy(array), htype)
+                batch = [random.randint(-50, 150) for i in range(n)]
+                q.push_many(iter(batch))
+                self.assertTrue(q.sanity())
+                expect = sorted(array + batch, reverse=htype == 'max')
+                self.assertListEqual(q.pop_many(20), expect[:20])
+                self.assertTrue(q.sanity())
+                self.assertListEqual(q.pop_many(10 ** 6), expect[20:])
+                self.assertListEqual(q.pop_many(5), [])
+
+            q = PriorityQueue(deepcopy(array), htype)
+            other = PriorityQueue(range(50), htype)
+            self.assertTrue(q.merge(other) is q)
+            self.assertTrue(q.sanity())
+            self.assertEqual(len(other.heap), 51)
+            self.assertListEqual(q.pop_many(250),
+                                 sorted(array + range(50),
+                                        reverse=htype == 'max'))
+
+        q = PriorityQueue([5, 3, 1], 'min')
+        self.assertEqual(q.pushpop(0), 0)  # would be the top, not pushed
+        self.assertEqual(q.pushpop(4), 1)
+        self.assertEqual(q.replace(9), 3)
+        self.assertTrue(q.sanity())
+        self.assertListEqual(q.pop_many(3), [4, 5, 9])
+        self.assertEqual(PriorityQueue([], 'min').pushpop(7), 7)
+        self.assertRaises(ValueError, q.merge, PriorityQueue([1], 'max'))
+
+    def test_threaded_queue(self):
+        import threading
+        from Queue import Empty, Full
+        from queues import ThreadedPriorityQueue
+        q = ThreadedPriorityQueue(maxsize=3)
+        for x in (5, 1, 3):
+            q.put(x)
+        self.assertTrue(q.full())
+        self.assertRaises(Full, q.put, 0, timeout=0.01)
+        self.assertRaises(Full, q.put_nowait, 0)
+        self.assertEqual(q.get(), 1)
+        self.assertListEqual(q.get_many(10), [3, 5])
+        self.assertRaises(Empty, q.get, timeout=0.01)
+        self.assertRaises(Empty, q.get_many, 2, False)
+
+        # producers blocked by maxsize, consumers in batches
+        q = ThreadedPriorityQueue(maxsize=10, htype='max')
+        items = range(1000)
+        got = []
+
+        def consume():
+            while True:
+                batch = q.get_many(7)
+                if None in batch:
+                    got.extend(x for x in batch if x is not None)
+                    return
+                got.extend(batch)
+
+        threads = [threading.Thread(target=q.put_many, args=(items[i::4],))
+                   for i in range(4)]
+        consumer = threading.Thread(target=consume)
+        for t in threads + [consumer]:
+            t.start()
+        for t in threads:
+            t.join()
+        q.put(None)  # smallest in python 2, comes out last of a max heap
+        consumer.join()
+        self.assertListEqual(sorted(got), items)
+
+    def test_async_queue(self):
+        import queues
+        asyncio = queues.asyncio
+        if asyncio is None:
+            self.skipTest('no asyncio')
+        loop = asyncio.new_event_loop()
+        try:
+            q = queues.AsyncPriorityQueue(maxsize=2, loop=loop)
+            waiting = q.get()
+            self.assertFalse(waiting.done())
+            q.put_nowait(4)
+            self.assertEqual(loop.run_until_complete(waiting), 4)
+
+            self.assertTrue(q.put(3).done())
+            self.assertTrue(q.put(1).done())
+            blocked = q.put(2)  # full, waits for room
+            self.assertFalse(blocked.done())
+            self.assertRaises(asyncio.QueueFull, q.put_nowait, 0)
+            self.assertEqual(loop.run_until_complete(q.get()), 1)
+            self.assertTrue(blocked.done())
+            self.assertListEqual(loop.run_until_complete(q.get_many(5)),
+                                 [2, 3])
+            self.assertRaises(asyncio.QueueEmpty, q.get_nowait)
+
+            self.assertRaises(asyncio.TimeoutError, loop.run_until_complete,
+                              q.get_many(3, timeout=0.01))
+            late = q.get()
+            loop.call_later(0.01, q.put_nowait, 9)
+            self.assertEqual(loop.run_until_complete(late), 9)
+            self.assertEqual(len(q.getters), 0)
+        finally:
+            loop.close()
+
+    def test_sort_key(self):
+        from heap import Heap
+        items = [(random.randint(0, 9), i) for i in range(200)]
+        for htype in ('max', 'min'):
+            for reverse in (False, True):
+                h = Heap(deepcopy(items), htype)
+                expect = sorted(h.heap[1:], key=lambda x: x[0],
+                                reverse=(htype == 'min') != reverse)
+                self.assertListEqual(
+                    h.sort(key=lambda x: x[0], reverse=reverse, keep=True),
+                    expect)
+                self.assertTrue(h.sanity())
+                self.assertEqual(len(h.heap), len(items) + 1)
+                self.assertListEqual(
+                    h.sort(key=lambda x: x[0], reverse=reverse), expect)
+                self.assertListEqual(h.heap, [0])  # same as without key
+
+    def test_merge_iter(self):
+        from heap import merge_iter, PriorityQueue
+        q = PriorityQueue([3, 1, 2])
+        self.assertEqual(q.replace_top(0), 3)
+        q.sanity()
+        self.assertEqual(q.find_top(), 2)
+
+        streams = [sorted(random.randint(0, 100) for i in range(n))
+                   for n in (0, 1, 50, 200, 7)]
+        merged = merge_iter(*[iter(s) for s in streams])
+        self.assertListEqual(list(merged), sorted(sum(streams, [])))
+        self.assertListEqual(list(merge_iter()), [])
+
+        # stable by source index, with key function
+        a = [(1, 'a'), (2, 'a'), (2, 'b')]
+        b = [(0, 'c'), (2, 'c'), (3, 'c')]
+        self.assertListEqual(list(merge_iter(a, b, key=lambda x: x[0])),
+                             [(0, 'c'), (1, 'a'), (2, 'a'), (2, 'b'),
+                              (2, 'c'), (3, 'c')])
+
+    def test_partial_sort(self):
+        from heap import partial_sort, sorted_iter
+        array = range(1000)
+        random.shuffle(array)
+        copy = deepcopy(array)
+        self.assertListEqual(partial_sort(array, 10), range(10))
+        self.assertListEqual(partial_sort(array, 5000), range(1000))
+        self.assertListEqual(partial_sort(array, 0), [])
+        self.assertListEqual(array, copy)
+
+        it = sorted_iter(array)
+        self.assertListEqual([next(it) for i in range(3)], [0, 1, 2])
+        self.assertListEqual(list(it), range(3, 1000))
+        self.assertListEqual(list(sorted_iter([])), [])
+
     def test_bheap(self):
         from bheap import BHeap
         array = range(100)
@@ -0,0 +1,219 @@
+'''
+cooperative sorting for event loops
+
+a long sort must not block the loop, so:
+    sort_slices -- generator sorting a list in place in small slices of
+                   work, resumable at any yield
+    sort_async -- asyncio future, sort_slices is driven for at most
+                  budget_ms per loop iteration, then control goes back to
+                  the loop
+    sort_in_process -- asyncio future, the sort runs in a forked process
+                       that inherits the input, a dead or stuck process
+                       fails the future of its own call only
+on python 2 the trollius backport provides asyncio
+'''
+import atexit
+import multiprocessing
+import threading
+import timeit
+
+import sort
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:  # only sort_slices works without an event loop
+        asyncio = None
+
+SLICE = 256  # about this many element moves between two yields
+
+
+def sort_slices(array, unit=SLICE):
+    '''
+    stable bottom-up merge sort of array in place, as a generator that
+    yields after about unit element moves
+    blocks are insertion sorted first, merges ping-pong between array and
+    one buffer of n
+    '''
+    length = len(array)
+    block = sort.INSERTION_CUTOFF
+    done = 0
+    for lo in xrange(0, length, block):
+        sort.binary_insert_sort(array, lo, min(lo + block, length), lo + 1)
+        done += block
+        if done >= unit:
+            done = 0
+            yield
+
+    src, dst = array, [None] * length
+    width = block
+    while width < length:
+        for lo in xrange(0, length, 2 * width):
+            mid, hi = min(lo + width, length), min(lo + 2 * width, length)
+            i, j, k = lo, mid, lo
+            while k < hi:
+                stop = min(k + unit, hi)
+                while k < stop:
+                    if j < hi and (i >= mid or src[j] < src[i]):
+                        dst[k] = src[j]
+                        j += 1
+                    else:
+                        dst[k] = src[i]
+                        i += 1
+                    k += 1
+                yield
+        src, dst = dst, src
+        width *= 2
+
+    if src is not array:  # copy back, in slices too
+        for lo in xrange(0, length, unit):
+            array[lo:lo + unit] = src[lo:lo + unit]
+            yield
+
+
+def sort_async(array, budget_ms=2, loop=None):
+    '''
+    sort array in place without blocking the event loop
+    every loop iteration runs the sort for at most budget_ms
+    return a future resolving to array, use as: await sort_async(data)
+    '''
+    loop = loop or asyncio.get_event_loop()
+    future = asyncio.Future(loop=loop)
+    steps = sort_slices(array)
+    budget = budget_ms / 1000.0
+    timer = timeit.default_timer
+
+    def run():
+        if future.cancelled():
+            return
+        deadline = timer() + budget
+        try:
+            for step in steps:
+                if timer() >= deadline:  # out of budget, yield to the loop
+                    loop.call_soon(run)
+                    return
+        except Exception as e:
+            future.set_exception(e)
+            return
+        future.set_result(array)
+
+    loop.call_soon(run)
+    return future
+
+
+def run_job(conn, func, array):
+    ''' body of a sort process: array came with the fork, (ok, result) out '''
+    try:
+        result = True, getattr(sort, func)(array)
+    except Exception as e:
+        result = False, '%s: %s' % (type(e).__name__, e)
+    conn.send(result)
+
+
+class SortJob(object):
+    '''
+    one sort in its own forked process
+    the child inherits array from the fork, only the result is pickled back
+    through a pipe; a thread waits for it and joins the process, so neither
+    unpickling nor joining happens on a loop thread. end of file on the
+    pipe means the process died, the future then fails. killing a job ends
+    its own process only, other jobs go on
+    '''
+    def __init__(self, func, array, loop):
+        self.loop = loop
+        self.future = asyncio.Future(loop=loop)
+        self.conn, child = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.Process(target=run_job,
+                                               args=(child, func, array))
+        self.process.daemon = True
+        self.process.start()
+        child.close()  # the pipe must end when the process does
+        running.add(self)
+        thread = threading.Thread(target=self.wait)
+        thread.daemon = True
+        thread.start()
+
+    def kill(self):
+        self.process.terminate()
+
+    def wait(self):
+        try:
+            ok, value = self.conn.recv()
+        except (EOFError, IOError):
+            ok, value = None, None
+        self.conn.close()
+        self.process.join()
+        running.discard(self)
+        if closing:  # interpreter exit, nobody waits
+            return
+        if ok is None:
+            ok, value = False, ('sort process died, exit code %s' %
+                                self.process.exitcode)
+        settle(self.loop, self.future, ok, value)
+
+
+def settle(loop, future, ok, value):
+    ''' resolve future on its loop, from any thread '''
+    def done():
+        if future.done():  # cancelled or timed out
+            return
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(RuntimeError(value))
+    try:
+        loop.call_soon_threadsafe(done)
+    except RuntimeError:  # loop closed, nobody waits any more
+        pass
+
+
+running = set()  # SortJobs whose process has not been joined yet
+closing = False
+
+
+@atexit.register
+def kill_jobs():
+    # before multiprocessing reaps the processes at exit, so the waiting
+    # threads do not report deaths while the interpreter shuts down
+    global closing
+    closing = True
+    for job in list(running):
+        job.kill()
+
+
+def sort_in_process(array, func='sort', loop=None, timeout=None):
+    '''
+    sort array by sort.<func> in a forked process
+    the input is inherited by the fork, the sorted list is pickled back
+    once and copied into array
+    return a future resolving to array; it fails with RuntimeError if the
+    process dies, and with TimeoutError after timeout seconds, in which
+    case the process is killed; other calls have their own processes and
+    are not affected
+    '''
+    loop = loop or asyncio.get_event_loop()
+    future = asyncio.Future(loop=loop)
+    job = SortJob(func, array, loop)
+
+    def done(result):
+        error = result.exception()  # retrieved even if nobody waits
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            array[:] = result.result()
+            future.set_result(array)
+
+    job.future.add_done_callback(done)
+    if timeout is not None:
+        def expire():
+            if not future.done():
+                job.kill()
+                future.set_exception(asyncio.TimeoutError())
+
+        handle = loop.call_later(timeout, expire)
+        future.add_done_callback(lambda f: handle.cancel())
+    return future
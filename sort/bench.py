@@ -0,0 +1,348 @@
+'''
+benchmark suite for sort.py
+
+    python bench.py run -o new.json                # default matrix
+    python bench.py run -a merge_sort intro_sort -s 1000 100000 -d zipf
+    python bench.py compare old.json new.json -t 0.1
+    python bench.py memory -n 100000               # memory overhead
+    python bench.py tune --save                    # tune kernel cutoffs
+
+every (algorithm, distribution, size) cell records
+    best / mean seconds of repeated runs, after warmup runs
+    comparisons and element moves, from one extra counting run
+    peak memory in bytes over the input, from a run in a forked child
+results are written as json, compare flags cells slower than threshold
+'''
+import os
+import sys
+import json
+import bisect
+import time
+import random
+import argparse
+import platform
+import timeit
+
+import sort
+from instrument import Collector
+
+try:
+    import resource
+except ImportError:  # no getrusage on windows
+    resource = None
+
+# ru_maxrss is in kilobytes on linux, in bytes on mac os
+RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+ALGORITHMS = ['merge_sort', 'quick_sort', 'intro_sort', 'heap_sort',
+              'inplace_merge_sort', 'quick_sort2', 'counting_sort',
+              'radix_sort', 'bucket_sort', 'insert_sort', 'insert_sort2']
+# O(n^2) sorts are only run up to this size
+QUADRATIC = {'insert_sort': 10 ** 4, 'insert_sort2': 10 ** 4}
+SIZES = [10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5]
+ALL_SIZES = [10 ** i for i in range(2, 8)]
+
+
+def gen_random(n):
+    return [random.randint(0, n) for i in xrange(n)]
+
+
+def gen_sorted(n):
+    return range(n)
+
+
+def gen_reversed(n):
+    return range(n, 0, -1)
+
+
+def gen_few_unique(n):
+    return [random.randint(0, 9) for i in xrange(n)]
+
+
+def gen_sawtooth(n):
+    teeth = max(n // 10, 1)
+    return [i % teeth for i in xrange(n)]
+
+
+def gen_organ_pipe(n):
+    half = n // 2
+    return range(half) + range(n - half, 0, -1)
+
+
+def gen_zipf(n, s=1.2):
+    ''' ranks 1..n, rank k drawn with probability proportional to 1/k^s '''
+    cdf = []
+    total = 0.0
+    for k in xrange(1, n + 1):
+        total += k ** -s
+        cdf.append(total)
+    return [bisect.bisect_left(cdf, random.random() * total) + 1
+            for i in xrange(n)]
+
+
+DISTRIBUTIONS = {
+    'random': gen_random,
+    'sorted': gen_sorted,
+    'reversed': gen_reversed,
+    'few_unique': gen_few_unique,
+    'sawtooth': gen_sawtooth,
+    'organ_pipe': gen_organ_pipe,
+    'zipf': gen_zipf,
+}
+
+
+def generate(dist, n, seed=0):
+    ''' reproducible input of distribution dist and size n '''
+    random.seed(seed)
+    return DISTRIBUTIONS[dist](n)
+
+
+def count_ops(func, data):
+    '''
+    (comparisons, moves) of one run of func on data
+    comparisons is None for sorts doing arithmetic on keys
+    '''
+    stats = Collector().run(func, list(data))
+    return stats['comparisons'], stats['moves']
+
+
+def peak_memory(func, data):
+    '''
+    peak bytes one run of func on a copy of data adds to the process
+    the run is done in a forked child, which reports how far its max
+    resident set size grew over the run through a pipe
+    page granular, and memory the allocator already held free is reused
+    without being counted; None without fork or getrusage, or if func fails
+    '''
+    if resource is None or not hasattr(os, 'fork'):
+        return None
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # child: never returns into the caller
+        try:
+            os.close(r)
+            array = list(data)
+            before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            func(array)
+            after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            os.write(w, str((after - before) * RSS_UNIT))
+        finally:
+            os._exit(0)
+    os.close(w)
+    with os.fdopen(r) as f:
+        out = f.read()
+    os.waitpid(pid, 0)
+    return int(out) if out else None
+
+
+def measure(func, data, repeat=5, warmup=1):
+    ''' seconds of every timed run, a fresh copy of data for each '''
+    timer = timeit.default_timer
+    for i in xrange(warmup):
+        func(list(data))
+    times = []
+    for i in xrange(repeat):
+        array = list(data)
+        start = timer()
+        func(array)
+        times.append(timer() - start)
+    return times
+
+
+def bench_one(name, dist, n, repeat=5, warmup=1, counts=True):
+    ''' result dict of one cell '''
+    func = getattr(sort, name)
+    data = generate(dist, n)
+    cell = {'algorithm': name, 'distribution': dist, 'n': n}
+    try:
+        times = measure(func, data, repeat, warmup)
+        cell.update(best=min(times), mean=sum(times) / len(times),
+                    runs=times)
+        if counts:
+            cell['comparisons'], cell['moves'] = count_ops(func, data)
+            cell['peak_bytes'] = peak_memory(func, data)
+    except Exception as e:  # e.g. recursion limit of quick_sort2
+        cell['error'] = '%s: %s' % (type(e).__name__, e)
+    return cell
+
+
+def run(algorithms=None, distributions=None, sizes=None, repeat=5,
+        warmup=1, counts=True, out=sys.stderr):
+    ''' benchmark the whole matrix, return json friendly dict '''
+    results = []
+    for name in algorithms or ALGORITHMS:
+        for dist in distributions or sorted(DISTRIBUTIONS):
+            for n in sizes or SIZES:
+                if n > QUADRATIC.get(name, n):
+                    continue
+                cell = bench_one(name, dist, n, repeat, warmup, counts)
+                results.append(cell)
+                if out:
+                    out.write('%-14s %-11s %9d %s\n' % (
+                        name, dist, n, cell.get('error') or
+                        '%.6fs' % cell['best']))
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': repeat,
+            'warmup': warmup,
+        },
+        'results': results,
+    }
+
+
+def compare(old, new, threshold=0.1):
+    '''
+    compare best times of two result dicts, cell by cell
+    return list of (algorithm, distribution, n, old, new, ratio) that are
+    slower than 1 + threshold
+    '''
+    key = lambda c: (c['algorithm'], c['distribution'], c['n'])
+    before = dict((key(c), c) for c in old['results'] if 'best' in c)
+    slower = []
+    for cell in new['results']:
+        prev = before.get(key(cell))
+        if prev is None or 'best' not in cell or not prev['best']:
+            continue
+        ratio = cell['best'] / prev['best']
+        if ratio > 1 + threshold:
+            slower.append(key(cell) + (prev['best'], cell['best'], ratio))
+    return slower
+
+
+def memory_report(algorithms=None, n=10 ** 5, dist='random'):
+    '''
+    memory overhead of every algorithm on one input, list of
+    (algorithm, peak bytes by peak_memory or None, elements copied out of
+    the array by slicing, summed over the whole run)
+    the slice total counts short lived temporaries again and again, it is
+    a measure of copying, the peak is the overhead
+    '''
+    data = generate(dist, n)
+    rows = []
+    for name in algorithms or ALGORITHMS:
+        if n > QUADRATIC.get(name, n):
+            continue
+        func = getattr(sort, name)
+        try:
+            copied = Collector().run(func, list(data))['allocations']
+            rows.append((name, peak_memory(func, data), copied))
+        except Exception as e:
+            rows.append((name, None, '%s: %s' % (type(e).__name__, e)))
+    return rows
+
+
+# tunable cutoff -> (sorts timed, candidate values)
+TUNE = {
+    'INSERTION_CUTOFF': (('quick_sort_recursive', 'intro_sort'),
+                         (4, 8, 12, 16, 24, 32, 48, 64)),
+    'MIN_MERGE': (('merge_sort',), (16, 32, 64, 128, 256)),
+}
+
+
+def tune(n=20000, repeat=3, out=sys.stderr):
+    '''
+    time every candidate of every TUNE cutoff on random input of size n
+    return {cutoff: fastest value}, sort module values are left unchanged
+    '''
+    data = generate('random', n)
+    best = {}
+    for name in sorted(TUNE):
+        funcs, candidates = TUNE[name]
+        saved = getattr(sort, name)
+        timings = []
+        try:
+            for value in candidates:
+                setattr(sort, name, value)
+                seconds = sum(min(measure(getattr(sort, f), data, repeat))
+                              for f in funcs)
+                timings.append((seconds, value))
+                if out:
+                    out.write('%-16s %4d %.6fs\n' % (name, value, seconds))
+        finally:
+            setattr(sort, name, saved)
+        best[name] = min(timings)[1]
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark sort.py')
+    sub = parser.add_subparsers(dest='command')
+    p = sub.add_parser('run', help='run benchmarks')
+    p.add_argument('-a', '--algorithms', nargs='+', choices=ALGORITHMS)
+    p.add_argument('-d', '--distributions', nargs='+',
+                   choices=sorted(DISTRIBUTIONS))
+    p.add_argument('-s', '--sizes', nargs='+', type=int)
+    p.add_argument('--all-sizes', action='store_true',
+                   help='sizes from 1e2 up to 1e7')
+    p.add_argument('-r', '--repeat', type=int, default=5)
+    p.add_argument('-w', '--warmup', type=int, default=1)
+    p.add_argument('--no-counts', action='store_true',
+                   help='skip comparison, move and memory counting')
+    p.add_argument('-o', '--output', help='json file, default stdout')
+    p = sub.add_parser('memory', help='peak memory overhead per algorithm')
+    p.add_argument('-a', '--algorithms', nargs='+', choices=ALGORITHMS)
+    p.add_argument('-n', type=int, default=10 ** 5)
+    p.add_argument('-d', '--distribution', default='random',
+                   choices=sorted(DISTRIBUTIONS))
+    p = sub.add_parser('tune', help='tune small-sort cutoffs on this machine')
+    p.add_argument('-n', type=int, default=20000)
+    p.add_argument('-r', '--repeat', type=int, default=3)
+    p.add_argument('--save', action='store_true',
+                   help='write the result to sort.TUNING_FILE')
+    p = sub.add_parser('compare', help='flag slowdowns between two runs')
+    p.add_argument('old')
+    p.add_argument('new')
+    p.add_argument('-t', '--threshold', type=float, default=0.1,
+                   help='allowed slowdown ratio, default 0.1')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        result = run(args.algorithms, args.distributions,
+                     ALL_SIZES if args.all_sizes else args.sizes,
+                     args.repeat, args.warmup, not args.no_counts)
+        text = json.dumps(result, indent=1, sort_keys=True)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(text)
+        else:
+            print text
+        return 0
+
+    if args.command == 'tune':
+        best = tune(args.n, args.repeat)
+        print json.dumps(best, sort_keys=True)
+        if args.save:
+            with open(sort.TUNING_FILE, 'w') as f:
+                json.dump(best, f, indent=1, sort_keys=True)
+        return 0
+
+    if args.command == 'memory':
+        input_bytes = args.n * 8  # the array of pointers itself
+        print '%-18s %14s %16s' % ('algorithm', 'peak/input',
+                                   'total sliced/n')
+        for name, peak, copied in memory_report(args.algorithms, args.n,
+                                                args.distribution):
+            if not isinstance(copied, int):
+                print '%-18s %s' % (name, copied)
+                continue
+            print '%-18s %14s %16.2f' % (
+                name, 'n/a' if peak is None else
+                '%.2f' % (peak / float(input_bytes)), copied / float(args.n))
+        return 0
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    slower = compare(old, new, args.threshold)
+    for name, dist, n, before, after, ratio in slower:
+        print '%-14s %-11s %9d %.6fs -> %.6fs (%.2fx)' % (
+            name, dist, n, before, after, ratio)
+    return 1 if slower else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
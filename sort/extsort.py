@@ -0,0 +1,157 @@
+'''
+external merge sort, for files bigger than memory
+
+    1. read the input in chunks that fit in the memory budget, sort every
+       chunk with sort.merge_sort and write it to a temp run file
+    2. k-way merge the runs with heap.merge_iter, one head record per run
+       in a min heap; if there are more runs than the budget can hold
+       read buffers for, merge in several passes
+
+two file formats:
+    text -- newline delimited records, compared as byte strings
+    binary -- fixed size records of an array typecode, e.g. 'l' or 'd'
+'''
+import os
+import sys
+import shutil
+import tempfile
+import array as pyarray
+
+import sort
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'heap'))
+from heap import merge_iter
+
+BLOCK = 1 << 20  # size of one buffered read/write, in bytes
+# a record in a python list costs several times its raw size, so only
+# raw bytes of budget / OVERHEAD are loaded per run
+OVERHEAD = 8
+
+
+def read_chunks(f, typecode, size):
+    ''' yield lists of records, each holding about size raw bytes '''
+    if typecode is None:
+        chunk, nbytes = [], 0
+        for line in f:
+            if not line.endswith('\n'):  # last line may miss its newline
+                line += '\n'
+            chunk.append(line)
+            nbytes += len(line)
+            if nbytes >= size:
+                yield chunk
+                chunk, nbytes = [], 0
+        if chunk:
+            yield chunk
+    else:
+        itemsize = pyarray.array(typecode).itemsize
+        size = max(size - size % itemsize, itemsize)
+        while True:
+            data = f.read(size)
+            if not data:
+                break
+            chunk = pyarray.array(typecode)
+            chunk.fromstring(data)
+            yield chunk.tolist()
+
+
+def read_run(path, typecode, block):
+    ''' iterate records of a run file, with block sized reads '''
+    with open(path, 'rb', block) as f:
+        for chunk in read_chunks(f, typecode, block):
+            for record in chunk:
+                yield record
+
+
+class RunWriter(object):
+    ''' buffer records and write them out a block at a time '''
+    def __init__(self, path, typecode, block):
+        self.f = open(path, 'wb', block)
+        self.typecode = typecode
+        self.limit = max(block // 64, 1) if typecode is None else \
+            max(block // pyarray.array(typecode).itemsize, 1)
+        self.buf = []
+
+    def write(self, record):
+        buf = self.buf
+        buf.append(record)
+        if len(buf) >= self.limit:
+            self.flush()
+
+    def extend(self, records):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        if self.typecode is None:
+            self.f.writelines(self.buf)
+        else:
+            pyarray.array(self.typecode, self.buf).tofile(self.f)
+        del self.buf[:]
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+
+def merge_runs(paths, out, typecode, block):
+    ''' k-way merge of sorted run files into writer out '''
+    runs = [read_run(path, typecode, block) for path in paths]
+    for record in merge_iter(*runs):
+        out.write(record)
+
+
+def merge_fanin(memory, block):
+    '''
+    runs merged at once within memory: one read buffer per run plus one
+    for the output, each block read is a list of OVERHEAD times its bytes
+    '''
+    return max(memory // (block * OVERHEAD) - 1, 2)
+
+
+def external_sort(src, dst, memory=256 << 20, typecode=None, tmpdir=None,
+                  block=BLOCK):
+    '''
+    sort file src into file dst with bounded memory
+    paras:
+        memory -- memory budget in bytes, sets the run size and merge fan-in
+        typecode -- None for text lines, or array typecode of binary records
+        tmpdir -- where run files go, default to system temp dir
+        block -- buffered I/O block size in bytes
+    return number of runs generated in the first pass
+    '''
+    fanin = merge_fanin(memory, block)
+    workdir = tempfile.mkdtemp(prefix='extsort', dir=tmpdir)
+    try:
+        runs = []
+        with open(src, 'rb', block) as f:
+            for chunk in read_chunks(f, typecode, max(memory // OVERHEAD, 1)):
+                path = os.path.join(workdir, 'run%d' % len(runs))
+                out = RunWriter(path, typecode, block)
+                out.extend(sort.merge_sort(chunk))
+                out.close()
+                runs.append(path)
+        nruns = len(runs)
+
+        # merge passes until the rest fits in one fan-in
+        npass = 0
+        while len(runs) > fanin:
+            merged = []
+            for i in xrange(0, len(runs), fanin):
+                group = runs[i:i + fanin]
+                path = os.path.join(workdir, 'pass%d_%d' % (npass, i))
+                out = RunWriter(path, typecode, block)
+                merge_runs(group, out, typecode, block)
+                out.close()
+                for run in group:
+                    os.remove(run)
+                merged.append(path)
+            runs = merged
+            npass += 1
+
+        out = RunWriter(dst, typecode, block)
+        merge_runs(runs, out, typecode, block)
+        out.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return nruns
@@ -0,0 +1,217 @@
+'''
+opt-in instrumentation of sort.py and heap.Heap
+
+nothing in the sort and heap hot paths looks for a collector, counting is
+done by instrumented variants that are swapped in only while it is on:
+    comparisons -- elements are wrapped in probes counting their compares
+    moves -- the array is a ProbeList, counting every element written
+    allocations -- elements copied out of the ProbeList by slicing, the
+                   temporary lists of merges and partitions
+    partitions, max_depth -- sort.partition is replaced by a variant
+                             measuring how deep quick_sort_recursive
+                             recursed
+    heapify -- Heap.heapify and Heap.heapify_up are replaced by counting
+               variants, one count per sift, down or up
+
+per call, counters of one sort are returned as a dict:
+    stats = Collector().run(sort.quick_sort_recursive, array)
+per module, hooks stay on for the whole block:
+    with Collector(callback).enabled(sort, Heap):
+        ...
+    callback gets the counters as a dict when the block exits
+'''
+import sys
+from contextlib import contextmanager
+
+import sort
+
+COUNTERS = ('comparisons', 'moves', 'allocations', 'partitions',
+            'max_depth', 'heapify')
+
+
+class NotComparison(Exception):
+    ''' a probe was used as a number, the sort is not comparison based '''
+
+
+class Probe(object):
+    '''
+    element wrapper, counts[comparisons] += 1 on every compare
+    arithmetic and conversions raise NotComparison
+    '''
+    __slots__ = ('value',)
+    counts = None  # set on the per collector subclass
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        self.counts['comparisons'] += 1
+        return self.value < other.value
+
+    def __le__(self, other):
+        self.counts['comparisons'] += 1
+        return self.value <= other.value
+
+    def __gt__(self, other):
+        self.counts['comparisons'] += 1
+        return self.value > other.value
+
+    def __ge__(self, other):
+        self.counts['comparisons'] += 1
+        return self.value >= other.value
+
+    def __eq__(self, other):
+        self.counts['comparisons'] += 1
+        return self.value == other.value
+
+    def __ne__(self, other):
+        self.counts['comparisons'] += 1
+        return self.value != other.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+
+def not_comparison(self, *args):
+    raise NotComparison('%s on a probe' % type(self.value).__name__)
+
+
+for name in ('add', 'radd', 'sub', 'rsub', 'mul', 'rmul', 'div', 'rdiv',
+             'truediv', 'rtruediv', 'floordiv', 'rfloordiv', 'mod', 'rmod',
+             'divmod', 'pow', 'neg', 'abs', 'lshift', 'rshift', 'and',
+             'rand', 'or', 'ror', 'xor', 'int', 'long', 'float', 'index'):
+    setattr(Probe, '__%s__' % name, not_comparison)
+
+
+class ProbeList(list):
+    ''' list counting elements written into it and sliced out of it '''
+    def __init__(self, counts, iterable=()):
+        list.__init__(self, iterable)
+        self.counts = counts
+
+    def __setitem__(self, i, value):
+        if isinstance(i, slice):
+            self.counts['moves'] += len(xrange(*i.indices(len(self))))
+        else:
+            self.counts['moves'] += 1
+        list.__setitem__(self, i, value)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            self.counts['allocations'] += len(xrange(*i.indices(len(self))))
+        return list.__getitem__(self, i)
+
+    # python 2 calls these for simple slices
+    def __setslice__(self, i, j, value):
+        self.counts['moves'] += len(xrange(*slice(i, j).indices(len(self))))
+        list.__setslice__(self, i, j, value)
+
+    def __getslice__(self, i, j):
+        self.counts['allocations'] += \
+            len(xrange(*slice(i, j).indices(len(self))))
+        return list.__getslice__(self, i, j)
+
+
+def traced_partition(counts, partition):
+    ''' partition variant counting calls and recursion depth of caller '''
+    def wrapper(array, i_left, i_right, i_pivot):
+        # depth: frames of the calling function on top of the stack
+        frame = sys._getframe(1)
+        code = frame.f_code
+        depth = 0
+        while frame is not None and frame.f_code is code:
+            depth += 1
+            frame = frame.f_back
+        counts['partitions'] += 1
+        counts['max_depth'] = max(counts['max_depth'], depth)
+        return partition(array, i_left, i_right, i_pivot)
+    return wrapper
+
+
+def counted_heapify(counts, heapify):
+    ''' Heap.heapify(_up) variant counting calls, one per sift '''
+    def wrapper(self, *args):
+        counts['heapify'] += 1
+        return heapify(self, *args)
+    return wrapper
+
+
+# attribute name -> factory of the instrumented variant
+HOOKS = {
+    'partition': traced_partition,
+    'heapify': counted_heapify,
+    'heapify_up': counted_heapify,
+}
+
+
+class Collector(object):
+    ''' counters of instrumented runs, exported as dict or to callback '''
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.probe = type('Probe', (Probe,), {'counts': self.counts,
+                                              '__slots__': ()})
+
+    def reset(self):
+        self.counts.update(dict.fromkeys(COUNTERS, 0))
+
+    def as_dict(self):
+        return dict(self.counts)
+
+    def emit(self):
+        stats = self.as_dict()
+        if self.callback is not None:
+            self.callback(stats)
+        return stats
+
+    @contextmanager
+    def enabled(self, *targets):
+        '''
+        swap instrumented variants into targets (modules or classes,
+        default sort module) for the block, restore originals after
+        '''
+        swapped = []
+        try:
+            for target in targets or (sort,):
+                for name, factory in HOOKS.items():
+                    original = target.__dict__.get(name)
+                    if original is not None:
+                        setattr(target, name, factory(self.counts, original))
+                        swapped.append((target, name, original))
+            yield self
+        finally:
+            for target, name, original in reversed(swapped):
+                setattr(target, name, original)
+            self.emit()
+
+    def run(self, func, array, *args, **kwargs):
+        '''
+        sort array in place by func(array, *args, **kwargs) with all
+        counters on, return counters of this call as a dict
+        comparisons is None when func does arithmetic on elements, then it
+        runs again on the bare elements
+        a key function gets the bare element, its result is compared as a
+        probe
+        '''
+        self.reset()
+        callback, self.callback = self.callback, None  # emit once, below
+        key = kwargs.get('key')
+        try:
+            with self.enabled(sort):
+                probes = ProbeList(self.counts, map(self.probe, array))
+                if key is not None:
+                    probe = self.probe
+                    kwargs['key'] = lambda x: probe(key(x.value))
+                try:
+                    result = func(probes, *args, **kwargs)
+                except NotComparison:
+                    if key is not None:
+                        kwargs['key'] = key
+                    self.reset()
+                    result = func(ProbeList(self.counts, array),
+                                  *args, **kwargs)
+                    self.counts['comparisons'] = None
+        finally:
+            self.callback = callback
+        array[:] = [x.value if isinstance(x, Probe) else x for x in result]
+        return self.emit()
@@ -0,0 +1,260 @@
+'''
+parallel sample sort on a pool of processes
+
+keys live in two shared memory buffers (multiprocessing.sharedctypes), the
+workers inherit them when the pool forks, so no key is ever pickled:
+    1. sample the input and pick workers - 1 splitters
+    2. every worker counts how many keys of its chunk fall in each bucket
+    3. offsets are computed from the counts, every worker scatters its
+       chunk into the output buffer, buckets end up contiguous
+    4. every worker sorts one bucket in place with a local sort of sort.py
+the output buffer is then the sorted array, no concatenation needed
+'''
+import bisect
+import multiprocessing
+import array as pyarray
+import random
+import time
+from multiprocessing.sharedctypes import RawArray
+
+import sort
+
+numpy = sort.numpy
+
+OVERSAMPLE = 32  # samples per bucket, more samples give even buckets
+MIN_PARALLEL = 1 << 16  # smaller inputs are not worth forking for
+
+# typecodes a shared buffer can hold
+TYPECODES = 'bBhHiIlLfd'
+
+# shared state of a worker, set by init_worker
+shared = {}
+
+
+def local_sort(array):
+    '''
+    best single process sort of sort.py for a bucket
+    integer buckets go through the vectorized radix sort when numpy is
+    around, everything else through the adaptive merge sort
+    '''
+    if numpy is not None and isinstance(array, numpy.ndarray) and \
+            array.dtype.kind in 'iu':
+        return sort.radix_sort_vec(array)
+    if numpy is not None and isinstance(array, numpy.ndarray):
+        return numpy.array(sort.merge_sort(array.tolist()), dtype=array.dtype)
+    return sort.merge_sort(array)
+
+
+def init_worker(src, dst, typecode, splitters, func):
+    shared.update(src=src, dst=dst, typecode=typecode,
+                  splitters=splitters, func=func)
+
+
+def view(buf, lo, hi):
+    ''' keys buf[lo:hi], a zero copy numpy view when possible '''
+    if numpy is not None:
+        dtype = numpy.dtype(shared['typecode'])
+        return numpy.frombuffer(buf, dtype=dtype, count=hi - lo,
+                                offset=lo * dtype.itemsize)
+    return buf[lo:hi]
+
+
+def bucket_of(chunk):
+    ''' bucket index of every key in chunk '''
+    splitters = shared['splitters']
+    if numpy is not None:
+        return numpy.searchsorted(splitters, chunk, side='right')
+    return [bisect.bisect_right(splitters, x) for x in chunk]
+
+
+def count_chunk(bounds):
+    ''' phase 2: histogram of buckets in src[lo:hi] '''
+    lo, hi = bounds
+    buckets = bucket_of(view(shared['src'], lo, hi))
+    nbucket = len(shared['splitters']) + 1
+    if numpy is not None:
+        return numpy.bincount(buckets, minlength=nbucket).tolist()
+    counts = [0] * nbucket
+    for b in buckets:
+        counts[b] += 1
+    return counts
+
+
+def scatter_chunk(task):
+    ''' phase 3: move src[lo:hi] into its buckets, starting at offsets '''
+    (lo, hi), offsets = task
+    chunk = view(shared['src'], lo, hi)
+    buckets = bucket_of(chunk)
+    dst = shared['dst']
+    if numpy is not None:
+        # group the chunk by bucket, then copy each group in one go
+        order = numpy.argsort(buckets, kind='stable')
+        chunk, buckets = chunk[order], buckets[order]
+        ends = numpy.searchsorted(buckets, numpy.arange(len(offsets)),
+                                  side='right')
+        out = view(dst, 0, len(dst))
+        start = 0
+        for b, end in enumerate(ends.tolist()):
+            if end > start:
+                out[offsets[b]:offsets[b] + end - start] = chunk[start:end]
+            start = end
+        return
+    offsets = list(offsets)
+    for x, b in zip(chunk, buckets):
+        dst[offsets[b]] = x
+        offsets[b] += 1
+
+
+def sort_bucket(bounds):
+    ''' phase 4: sort dst[lo:hi] in place '''
+    lo, hi = bounds
+    if hi - lo < 2:
+        return
+    dst = shared['dst']
+    func = shared['func']
+    if numpy is not None:
+        keys = view(dst, lo, hi)
+        keys[:] = func(keys)
+    else:
+        dst[lo:hi] = func(dst[lo:hi])
+
+
+def pick_splitters(array, nbucket):
+    ''' nbucket - 1 splitters from a sorted random sample '''
+    n = len(array)
+    size = min(n, nbucket * OVERSAMPLE)
+    picks = random.sample(xrange(n), size)
+    sample = sort.merge_sort([array[i] for i in picks])
+    return [sample[size * i // nbucket] for i in xrange(1, nbucket)]
+
+
+def chunks(n, parts):
+    ''' split range(n) into parts nearly equal (lo, hi) ranges '''
+    return [(n * i // parts, n * (i + 1) // parts) for i in xrange(parts)]
+
+
+def typecode_of(array):
+    '''
+    typecode of a shared buffer holding every key of array exactly
+    array.array and numpy arrays keep their own type; lists of ints go to
+    'l', lists with floats to 'd'
+    raise TypeError for non numeric keys, OverflowError for ints that do
+    not fit
+    '''
+    if isinstance(array, pyarray.array):
+        if array.typecode not in TYPECODES:
+            raise TypeError('no shared buffer for typecode %r' %
+                            array.typecode)
+        return array.typecode
+    if numpy is not None and isinstance(array, numpy.ndarray):
+        dtype = array.dtype
+        if dtype.char in TYPECODES:
+            return dtype.char
+        for typecode in TYPECODES:  # same type under another name
+            if numpy.dtype(typecode) == dtype:
+                return typecode
+        raise TypeError('no shared buffer for dtype %s' % dtype)
+    kinds = set(map(type, array))
+    if not kinds <= set((int, long, bool, float)):
+        raise TypeError('keys must be numbers, not %s' %
+                        ', '.join(sorted(k.__name__ for k in kinds)))
+    if float not in kinds:
+        if array and (min(array) < -2 ** 63 or max(array) >= 2 ** 63):
+            raise OverflowError('int keys do not fit in 64 bits')
+        return 'l'
+    if kinds != set((float,)):  # ints among floats must be exact doubles
+        if any(abs(x) > 2 ** 53 for x in array if type(x) is not float):
+            raise OverflowError('int keys have no exact float')
+    return 'd'
+
+
+def parallel_sort(array, workers=None, typecode=None, func=None):
+    '''
+    sample sort with a process pool
+    paras:
+        array -- list, array.array or numpy array of numbers
+        workers -- number of processes, default to cpu count
+        typecode -- typecode of the shared buffers, default typecode_of
+                    array; ValueError if it differs from that
+        func -- local sort for a bucket, default local_sort
+    return a sorted list, or numpy array if input is a numpy array
+    '''
+    func = func or local_sort
+    workers = workers or multiprocessing.cpu_count()
+    exact = typecode_of(array)
+    if typecode is not None and typecode != exact:
+        raise ValueError('keys need typecode %r, not %r' % (exact, typecode))
+    typecode = exact
+    n = len(array)
+    if workers < 2 or n < MIN_PARALLEL:
+        if numpy is not None and isinstance(array, numpy.ndarray):
+            return func(array.copy())
+        return func(list(array))
+
+    src = RawArray(typecode, n)
+    dst = RawArray(typecode, n)
+    if numpy is not None:
+        numpy.frombuffer(src, dtype=numpy.dtype(typecode))[:] = array
+    else:
+        src[:] = array
+    splitters = pick_splitters(array, workers)
+
+    pool = multiprocessing.Pool(workers, init_worker,
+                                (src, dst, typecode, splitters, func))
+    try:
+        ranges = chunks(n, workers)
+        counts = pool.map(count_chunk, ranges)
+        # offsets[c][b]: where chunk c writes its first key of bucket b
+        offsets = [[0] * workers for c in ranges]
+        buckets = []
+        pos = 0
+        for b in xrange(workers):
+            start = pos
+            for c in xrange(len(ranges)):
+                offsets[c][b] = pos
+                pos += counts[c][b]
+            buckets.append((start, pos))
+        pool.map(scatter_chunk, zip(ranges, offsets))
+        # biggest buckets first, for a better load balance
+        pool.map(sort_bucket, sorted(buckets, key=lambda r: r[0] - r[1]),
+                 chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    if numpy is not None:
+        result = numpy.frombuffer(dst, dtype=numpy.dtype(typecode)).copy()
+        return result if isinstance(array, numpy.ndarray) else result.tolist()
+    return dst[:]
+
+
+def speedup(n=10 ** 6, workers=None, typecode='l'):
+    '''
+    time parallel_sort against the single process local sort on n random
+    keys, return (single seconds, parallel seconds, speedup)
+    '''
+    workers = workers or multiprocessing.cpu_count()
+    if typecode == 'd':
+        array = [random.random() for i in xrange(n)]
+    else:
+        array = [random.randint(-2 ** 62, 2 ** 62) for i in xrange(n)]
+    if numpy is not None:
+        array = numpy.array(array)
+
+    start = time.time()
+    parallel_sort(array, workers=1, typecode=typecode)
+    single = time.time() - start
+
+    start = time.time()
+    parallel_sort(array, workers=workers, typecode=typecode)
+    multi = time.time() - start
+    return single, multi, single / multi
+
+
+if __name__ == '__main__':
+    import sys
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    single, multi, ratio = speedup(n, workers)
+    print 'n=%d single %.3fs parallel %.3fs speedup %.2fx' % (
+        n, single, multi, ratio)
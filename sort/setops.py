@@ -0,0 +1,188 @@
+'''
+operations on sorted sequences
+
+inputs must be sorted ascending; duplicates are treated as a multiset:
+intersection keeps the min count of a value, union the max count and
+difference subtracts counts
+the shorter sequence drives, the longer one is searched by galloping
+(exponential then binary search from the last position), so very unequal
+sizes m << n cost O(m*log(n/m)) comparisons instead of O(m + n)
+'''
+from sort import gallop_left, gallop_right, sort
+
+
+def intersect(a, b):
+    ''' sorted common elements of sorted a and b '''
+    if len(a) > len(b):
+        a, b = b, a
+    result = []
+    n = len(b)
+    j = 0
+    for x in a:
+        if j == n:
+            break
+        j += gallop_left(x, b, j, n - j, 0)
+        if j < n and not x < b[j]:  # b[j] == x
+            result.append(x)
+            j += 1
+    return result
+
+
+def union(a, b):
+    ''' sorted elements of either sorted a or b '''
+    if len(a) > len(b):
+        a, b = b, a
+    result = []
+    n = len(b)
+    j = 0
+    for x in a:
+        k = j + gallop_left(x, b, j, n - j, 0) if j < n else n
+        result.extend(b[j:k])  # elements of b below x, in one block
+        j = k
+        if j < n and not x < b[j]:  # in both, emit once
+            j += 1
+        result.append(x)
+    result.extend(b[j:])
+    return result
+
+
+def difference(a, b):
+    ''' sorted elements of sorted a that are not in sorted b '''
+    result = []
+    m, n = len(a), len(b)
+    if m <= n:  # a drives, gallop in b
+        j = 0
+        for x in a:
+            if j < n:
+                j += gallop_left(x, b, j, n - j, 0)
+            if j < n and not x < b[j]:
+                j += 1
+            else:
+                result.append(x)
+        return result
+    # b drives, copy blocks of a between its elements
+    i = 0
+    for y in b:
+        if i == m:
+            break
+        k = i + gallop_left(y, a, i, m - i, 0)
+        result.extend(a[i:k])
+        i = k
+        if i < m and not y < a[i]:  # drop one copy of y
+            i += 1
+    result.extend(a[i:])
+    return result
+
+
+def intersect_many(*sequences):
+    '''
+    sorted elements common to all sorted sequences
+    candidates come from the smallest sequence, every other one is
+    galloped forward from its cursor
+    '''
+    if not sequences:
+        return []
+    sequences = sorted(sequences, key=len)
+    first, rest = sequences[0], sequences[1:]
+    cursors = [0] * len(rest)
+    result = []
+    for x in first:
+        common = True
+        for t, seq in enumerate(rest):
+            j, n = cursors[t], len(seq)
+            if j < n:
+                j += gallop_left(x, seq, j, n - j, 0)
+            cursors[t] = j
+            if j == n:  # one sequence is exhausted, nothing more in common
+                return result
+            if x < seq[j]:
+                common = False
+                break
+        if common:
+            result.append(x)
+            for t in xrange(len(rest)):
+                cursors[t] += 1
+    return result
+
+
+def advance(array, lo, key, func, upper=False):
+    '''
+    first index i >= lo of sorted array with func(array[i]) >= key, or
+    > key if upper; exponential search from lo, then binary search
+    '''
+    n = len(array)
+    if upper:
+        before = lambda i: not key < func(array[i])
+    else:
+        before = lambda i: func(array[i]) < key
+    last, ofs = lo - 1, 1
+    while lo + ofs - 1 < n and before(lo + ofs - 1):
+        last, ofs = lo + ofs - 1, ofs << 1
+    hi = min(lo + ofs - 1, n)
+    # binary search in (last, hi]
+    last += 1
+    while last < hi:
+        m = last + ((hi - last) >> 1)
+        if before(m):
+            last = m + 1
+        else:
+            hi = m
+    return hi
+
+
+def merge_join(left, right, left_key=None, right_key=None):
+    '''
+    inner join of two sequences sorted by their keys
+    yield (l, r) for every pair with equal keys, groups of equal keys give
+    their cross product
+    the side behind gallops to the key of the other, so long stretches
+    without a match cost O(log(length))
+    '''
+    left_key = left_key or (lambda x: x)
+    right_key = right_key or left_key
+    i, j = 0, 0
+    m, n = len(left), len(right)
+    while i < m and j < n:
+        lk, rk = left_key(left[i]), right_key(right[j])
+        if lk < rk:
+            i = advance(left, i + 1, rk, left_key)
+        elif rk < lk:
+            j = advance(right, j + 1, lk, right_key)
+        else:
+            i_end = advance(left, i + 1, lk, left_key, upper=True)
+            j_end = advance(right, j + 1, rk, right_key, upper=True)
+            for l in left[i:i_end]:
+                for r in right[j:j_end]:
+                    yield l, r
+            i, j = i_end, j_end
+
+
+def sort_unique(array):
+    ''' sort array in place and drop duplicates, return array '''
+    sort(array)
+    k = 0
+    for x in array:
+        if k == 0 or array[k - 1] < x:
+            array[k] = x
+            k += 1
+    del array[k:]
+    return array
+
+
+def group_runs(array, key=None):
+    '''
+    yield (key, run) for every run of equal keys of a sorted array
+    the end of a run is found by galloping, so long runs cost
+    O(log(length)) comparisons
+    '''
+    n = len(array)
+    i = 0
+    while i < n:
+        if key is None:
+            k = array[i]
+            end = i + gallop_right(k, array, i, n - i, 0)
+        else:
+            k = key(array[i])
+            end = advance(array, i + 1, k, key, upper=True)
+        yield k, array[i:end]
+        i = end
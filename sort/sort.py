@@ -1,11 +1,24 @@
+import os
+import json
 import random
 import math
+import bisect
+import struct
+from itertools import izip, imap, repeat
+import array as pyarray
 
+try:
+    import numpy
+except ImportError:  # vectorized sorts are optional
+    numpy = None
 
-def insert_sort(array):
+
+def insert_sort(array, key=None, reverse=False):
     ''' insert sort
         T(n) = O(n^2)
     '''
+    if key is not None or reverse:
+        return sort_by(array, key, reverse)
     l = len(array)
     for i in xrange(0, l):
         for j in xrange(i, l):
@@ -15,10 +28,12 @@ def insert_sort(array):
     return array
 
 
-def insert_sort2(array):
+def insert_sort2(array, key=None, reverse=False):
     ''' insert sort without list insert support
         cache friendly, inplace sort, but slower
     '''
+    if key is not None or reverse:
+        return sort_by(array, key, reverse)
     l = len(array)
     for i in xrange(0, l - 1):
         # the head ith array has been sorted
@@ -31,29 +46,494 @@ def insert_sort2(array):
     return array
 
 
-def merge_sort(array):
-    ''' merge sort
-        T(n) = O(n*log(n))
+MIN_GALLOP = 7  # start galloping after this many consecutive wins of one run
+MIN_MERGE = 64  # runs shorter than MIN_MERGE / 2 are extended, tunable
+
+
+def binary_insert_sort(array, lo, hi, start):
+    ''' binary insertion sort on array[lo:hi], array[lo:start] is sorted
+        stable: an element is inserted after its equal peers
+        T(n) = O(n*log(n)) compares, O(n^2) moves
+    '''
+    for i in xrange(start, hi):
+        pivot = array[i]
+        l, r = lo, i
+        while l < r:
+            m = (l + r) >> 1
+            if pivot < array[m]:
+                r = m
+            else:
+                l = m + 1
+        if l < i:
+            array[l + 1:i + 1] = array[l:i]  # shift right by one slot
+            array[l] = pivot
+    return array
+
+
+# optimal sorting networks, (i, j) compare-exchanges in order
+NETWORK_PAIRS = {
+    2: [(0, 1)],
+    3: [(1, 2), (0, 2), (0, 1)],
+    4: [(0, 1), (2, 3), (0, 2), (1, 3), (1, 2)],
+    5: [(0, 1), (3, 4), (2, 4), (2, 3), (0, 3), (0, 2), (1, 4), (1, 3),
+        (1, 2)],
+    6: [(1, 2), (4, 5), (0, 2), (3, 5), (0, 1), (3, 4), (2, 5), (0, 3),
+        (1, 4), (2, 4), (1, 3), (2, 3)],
+    7: [(1, 2), (3, 4), (5, 6), (0, 2), (3, 5), (4, 6), (0, 1), (4, 5),
+        (2, 6), (0, 4), (1, 5), (0, 3), (2, 5), (1, 3), (2, 4), (2, 3)],
+    8: [(0, 2), (1, 3), (4, 6), (5, 7), (0, 4), (1, 5), (2, 6), (3, 7),
+        (0, 1), (2, 3), (4, 5), (6, 7), (2, 4), (3, 5), (1, 4), (3, 6),
+        (1, 2), (3, 4), (5, 6)],
+}
+
+
+def make_network(n, pairs):
+    '''
+    build an unrolled sorting network function f(array, lo) for
+    array[lo:lo + n]: elements are loaded in locals, compare-exchanged in
+    straight line code, then stored back
+    '''
+    names = ['a%d' % i for i in xrange(n)]
+    lines = ['def network%d(array, lo):' % n]
+    lines += ['    %s = array[lo + %d]' % (names[i], i) for i in xrange(n)]
+    for i, j in pairs:
+        lines.append('    if %s < %s: %s, %s = %s, %s' % (
+            names[j], names[i], names[i], names[j], names[j], names[i]))
+    lines += ['    array[lo + %d] = %s' % (i, names[i]) for i in xrange(n)]
+    namespace = {}
+    exec('\n'.join(lines), namespace)
+    return namespace['network%d' % n]
+
+
+NETWORKS = dict((n, make_network(n, pairs))
+                for n, pairs in NETWORK_PAIRS.items())
+
+
+def small_sort(array, lo, hi):
+    '''
+    kernel for short array[lo:hi], base case of divide and conquer sorts
+    sorting network for up to 8 elements, binary insertion sort above
+    not stable
+    '''
+    n = hi - lo
+    if n in NETWORKS:
+        NETWORKS[n](array, lo)
+    elif n > 8:
+        binary_insert_sort(array, lo, hi, lo + 1)
+    return array
+
+
+def count_run(array, lo, hi):
+    '''
+    length of the natural run starting at array[lo]
+    a strictly descending run is reversed in place, so the returned run
+    is always ascending (strictness keeps the sort stable)
+    '''
+    i = lo + 1
+    if i == hi:
+        return 1
+    if array[i] < array[lo]:  # descending
+        i += 1
+        while i < hi and array[i] < array[i - 1]:
+            i += 1
+        array[lo:i] = array[lo:i][::-1]
+    else:
+        i += 1
+        while i < hi and not array[i] < array[i - 1]:
+            i += 1
+    return i - lo
+
+
+def gallop_left(key, array, base, n, hint):
+    '''
+    locate key in sorted array[base:base + n], search starts at base + hint
+    return k that array[base + k - 1] < key <= array[base + k]
+    i.e. key would be inserted before its equal elements
+    '''
+    ofs, last = 1, 0
+    if array[base + hint] < key:
+        # gallop right until array[base + hint + last] < key <= [hint + ofs]
+        maxofs = n - hint
+        while ofs < maxofs and array[base + hint + ofs] < key:
+            last, ofs = ofs, (ofs << 1) + 1
+        ofs = min(ofs, maxofs)
+        last, ofs = hint + last, hint + ofs
+    else:
+        # gallop left until array[hint - ofs] < key <= array[hint - last]
+        maxofs = hint + 1
+        while ofs < maxofs and not array[base + hint - ofs] < key:
+            last, ofs = ofs, (ofs << 1) + 1
+        ofs = min(ofs, maxofs)
+        last, ofs = hint - ofs, hint - last
+    # binary search in (last, ofs]
+    last += 1
+    while last < ofs:
+        m = last + ((ofs - last) >> 1)
+        if array[base + m] < key:
+            last = m + 1
+        else:
+            ofs = m
+    return ofs
+
+
+def gallop_right(key, array, base, n, hint):
+    '''
+    like gallop_left, but return k that
+    array[base + k - 1] <= key < array[base + k]
+    i.e. key would be inserted after its equal elements
+    '''
+    ofs, last = 1, 0
+    if key < array[base + hint]:
+        maxofs = hint + 1
+        while ofs < maxofs and key < array[base + hint - ofs]:
+            last, ofs = ofs, (ofs << 1) + 1
+        ofs = min(ofs, maxofs)
+        last, ofs = hint - ofs, hint - last
+    else:
+        maxofs = n - hint
+        while ofs < maxofs and not key < array[base + hint + ofs]:
+            last, ofs = ofs, (ofs << 1) + 1
+        ofs = min(ofs, maxofs)
+        last, ofs = hint + last, hint + ofs
+    last += 1
+    while last < ofs:
+        m = last + ((ofs - last) >> 1)
+        if key < array[base + m]:
+            ofs = m
+        else:
+            last = m + 1
+    return ofs
+
+
+def min_run(n):
+    '''
+    min length of a run, short runs are extended by binary insertion
+    result is in [MIN_MERGE / 2, MIN_MERGE], and n / min_run is a power of
+    2 or a bit less so the final merges are well balanced
+    '''
+    r = 0
+    while n >= MIN_MERGE:
+        r |= n & 1
+        n >>= 1
+    return n + r
+
+
+def merge_sort(array, key=None, reverse=False):
+    ''' adaptive merge sort (timsort), stable and in place
+        natural runs are detected and merged with galloping, using only one
+        temp buffer of at most n/2 elements
+        T(n) = O(n*log(n)), O(n) on presorted input
     '''
-    def merge(a1, a2):
-        ''' merge two sorted list into one '''
-        ret = []
-        while a1 and a2:
-            if a1[0] < a2[0]:
-                val = a1.pop(0)
+    if key is not None or reverse:
+        return sort_by(array, key, reverse)
+    length = len(array)
+    if length < 2:
+        return array
+
+    tmp = []  # reusable merge buffer, grows to the smaller run
+    runs = []  # stack of pending runs: (base, length)
+    min_gallop = [MIN_GALLOP]  # adaptive, shared across all merges
+
+    def reserve(n):
+        if len(tmp) < n:
+            tmp.extend([None] * (n - len(tmp)))
+
+    def merge_lo(lo, na, nb):
+        ''' merge array[lo:lo+na] and the following nb elements, na <= nb '''
+        reserve(na)
+        tmp[0:na] = array[lo:lo + na]
+        dest, pa, pb = lo, 0, lo + na
+        mg = min_gallop[0]
+        while na and nb:
+            acount = bcount = 0
+            # one pair at a time, until a run wins too often
+            while acount < mg and bcount < mg:
+                if array[pb] < tmp[pa]:
+                    array[dest] = array[pb]
+                    pb += 1
+                    nb -= 1
+                    bcount += 1
+                    acount = 0
+                    if not nb:
+                        break
+                else:
+                    array[dest] = tmp[pa]
+                    pa += 1
+                    na -= 1
+                    acount += 1
+                    bcount = 0
+                    if not na:
+                        break
+                dest += 1
+            else:
+                # galloping, move whole blocks found by exponential search
+                mg += 1
+                while True:
+                    mg -= mg > 1
+                    acount = k = gallop_right(array[pb], tmp, pa, na, 0)
+                    if k:
+                        array[dest:dest + k] = tmp[pa:pa + k]
+                        dest += k
+                        pa += k
+                        na -= k
+                        if not na:
+                            break
+                    array[dest] = array[pb]
+                    dest += 1
+                    pb += 1
+                    nb -= 1
+                    if not nb:
+                        break
+                    bcount = k = gallop_left(tmp[pa], array, pb, nb, 0)
+                    if k:
+                        array[dest:dest + k] = array[pb:pb + k]
+                        dest += k
+                        pb += k
+                        nb -= k
+                        if not nb:
+                            break
+                    array[dest] = tmp[pa]
+                    dest += 1
+                    pa += 1
+                    na -= 1
+                    if not na:
+                        break
+                    if acount < MIN_GALLOP and bcount < MIN_GALLOP:
+                        break
+                mg += 1  # penalty for leaving galloping mode
+                continue
+            dest += 1
+        # the rest of b is already in place
+        if na:
+            array[dest:dest + na] = tmp[pa:pa + na]
+        min_gallop[0] = mg
+
+    def merge_hi(lo, na, nb):
+        ''' like merge_lo but na > nb, merge from right to left '''
+        mid = lo + na
+        reserve(nb)
+        tmp[0:nb] = array[mid:mid + nb]
+        dest = mid + nb - 1
+        mg = min_gallop[0]
+        while na and nb:
+            acount = bcount = 0
+            while acount < mg and bcount < mg:
+                pa = lo + na - 1
+                if tmp[nb - 1] < array[pa]:
+                    array[dest] = array[pa]
+                    na -= 1
+                    acount += 1
+                    bcount = 0
+                    if not na:
+                        break
+                else:
+                    array[dest] = tmp[nb - 1]
+                    nb -= 1
+                    bcount += 1
+                    acount = 0
+                    if not nb:
+                        break
+                dest -= 1
             else:
-                val = a2.pop(0)
-            ret.append(val)
-        return ret + a1 + a2
-
-    def recursor(a):
-        length = len(a)
-        if length == 1:
-            return a
+                mg += 1
+                while True:
+                    mg -= mg > 1
+                    # elements of a bigger than b's last go to the end
+                    k = na - gallop_right(tmp[nb - 1], array, lo, na, na - 1)
+                    acount = k
+                    if k:
+                        array[dest - k + 1:dest + 1] = \
+                            array[lo + na - k:lo + na]
+                        dest -= k
+                        na -= k
+                        if not na:
+                            break
+                    array[dest] = tmp[nb - 1]
+                    dest -= 1
+                    nb -= 1
+                    if not nb:
+                        break
+                    # elements of b not less than a's last go to the end
+                    k = nb - gallop_left(array[lo + na - 1], tmp, 0, nb, nb - 1)
+                    bcount = k
+                    if k:
+                        array[dest - k + 1:dest + 1] = tmp[nb - k:nb]
+                        dest -= k
+                        nb -= k
+                        if not nb:
+                            break
+                    array[dest] = array[lo + na - 1]
+                    dest -= 1
+                    na -= 1
+                    if not na:
+                        break
+                    if acount < MIN_GALLOP and bcount < MIN_GALLOP:
+                        break
+                mg += 1
+                continue
+            dest -= 1
+        # the rest of a is already in place
+        if nb:
+            array[dest - nb + 1:dest + 1] = tmp[0:nb]
+        min_gallop[0] = mg
+
+    def merge_at(i):
+        ''' merge runs[i] and runs[i + 1] '''
+        base_a, na = runs[i]
+        base_b, nb = runs[i + 1]
+        runs[i] = (base_a, na + nb)
+        del runs[i + 1]
+        # elements of a not bigger than b[0] are already in place
+        k = gallop_right(array[base_b], array, base_a, na, 0)
+        base_a += k
+        na -= k
+        if not na:
+            return
+        # so are elements of b not less than a[-1]
+        nb = gallop_left(array[base_a + na - 1], array, base_b, nb, nb - 1)
+        if not nb:
+            return
+        if na <= nb:
+            merge_lo(base_a, na, nb)
         else:
-            return merge(recursor(a[:length / 2]), recursor(a[length / 2:]))
+            merge_hi(base_a, na, nb)
 
-    return recursor(array)
+    def merge_collapse():
+        ''' keep run lengths growing at least like fibonacci numbers '''
+        while len(runs) > 1:
+            n = len(runs) - 2
+            if (n > 0 and runs[n - 1][1] <= runs[n][1] + runs[n + 1][1]) or \
+                    (n > 1 and runs[n - 2][1] <= runs[n - 1][1] + runs[n][1]):
+                if runs[n - 1][1] < runs[n + 1][1]:
+                    n -= 1
+            elif runs[n][1] > runs[n + 1][1]:
+                break
+            merge_at(n)
+
+    minrun = min_run(length)
+    lo = 0
+    while lo < length:
+        run = count_run(array, lo, length)
+        if run < minrun:  # extend short run to minrun
+            force = min(minrun, length - lo)
+            binary_insert_sort(array, lo, lo + force, lo + run)
+            run = force
+        runs.append((lo, run))
+        merge_collapse()
+        lo += run
+
+    while len(runs) > 1:  # force merge the remaining runs
+        n = len(runs) - 2
+        if n > 0 and runs[n - 1][1] < runs[n + 1][1]:
+            n -= 1
+        merge_at(n)
+    return array
+
+
+INPLACE_BLOCK = 20  # block size insertion sorted before in-place merging
+
+
+def swap_range(array, a, b, n):
+    ''' swap array[a:a + n] with array[b:b + n], ranges must not overlap '''
+    for i in xrange(n):
+        array[a + i], array[b + i] = array[b + i], array[a + i]
+
+
+def rotate(array, a, m, b):
+    '''
+    rotate array[a:b] in place so that array[m:b] comes before array[a:m]
+    by block swaps, no extra memory
+    '''
+    i, j = m - a, b - m
+    while i != j:
+        if i > j:
+            swap_range(array, m - i, m, j)
+            i -= j
+        else:
+            swap_range(array, m - i, m + j - i, i)
+            j -= i
+    swap_range(array, m - i, m, i)
+
+
+def sym_merge(array, a, m, b):
+    '''
+    stable in-place merge of sorted array[a:m] and array[m:b] (SymMerge)
+    the longer run is split at its middle, its symmetric split point in
+    the other run found by binary search, the middle part rotated, then
+    both halves merged recursively
+    T(n) = O(n*log(n)) moves, recursion depth O(log(n)), no buffer
+    '''
+    if m - a == 1:  # insert array[a] into array[m:b]
+        i, j = m, b
+        while i < j:
+            h = (i + j) >> 1
+            if array[h] < array[a]:
+                i = h + 1
+            else:
+                j = h
+        x = array[a]
+        for k in xrange(a, i - 1):
+            array[k] = array[k + 1]
+        array[i - 1] = x
+        return
+    if b - m == 1:  # insert array[m] into array[a:m]
+        i, j = a, m
+        while i < j:
+            h = (i + j) >> 1
+            if not array[m] < array[h]:
+                i = h + 1
+            else:
+                j = h
+        x = array[m]
+        for k in xrange(m, i, -1):
+            array[k] = array[k - 1]
+        array[i] = x
+        return
+
+    mid = (a + b) >> 1
+    n = mid + m
+    if m > mid:
+        start, r = n - b, mid
+    else:
+        start, r = a, m
+    p = n - 1
+    while start < r:
+        c = (start + r) >> 1
+        if not array[p - c] < array[c]:
+            start = c + 1
+        else:
+            r = c
+    end = n - start
+    if start < m < end:
+        rotate(array, start, m, end)
+    if a < start < mid:
+        sym_merge(array, a, start, mid)
+    if mid < end < b:
+        sym_merge(array, mid, end, b)
+
+
+def inplace_merge_sort(array):
+    '''
+    stable merge sort without any buffer, for when memory is the limit
+    blocks are insertion sorted, then merged bottom up by sym_merge
+    T(n) = O(n*log(n)^2), extra space O(log(n)) for the merge recursion
+    '''
+    length = len(array)
+    for lo in xrange(0, length, INPLACE_BLOCK):
+        hi = min(lo + INPLACE_BLOCK, length)
+        for i in xrange(lo + 1, hi):
+            x = array[i]
+            j = i
+            while j > lo and x < array[j - 1]:
+                array[j] = array[j - 1]
+                j -= 1
+            array[j] = x
+    width = INPLACE_BLOCK
+    while width < length:
+        for a in xrange(0, length - width, 2 * width):
+            sym_merge(array, a, a + width, min(a + 2 * width, length))
+        width *= 2
+    return array
 
 
 def partition(array, i_left, i_right, i_pivot):
@@ -69,14 +549,19 @@ def partition(array, i_left, i_right, i_pivot):
     return i_stored  # return pivot index
 
 
-def quick_sort(array):
+def quick_sort_recursive(array, key=None, reverse=False):
     '''
-    in-place quick sort
-    worse case: T(n) = O(n^2)
+    in-place textbook quick sort, random pivot and 2-way partition
+    worse case: T(n) = O(n^2), also for many duplicate keys
     randomize case: T(n) = O(n*log(n))
+    recursion depth grows with the worst case, use quick_sort
     '''
+    if key is not None or reverse:
+        return sort_by(array, key, reverse)
     def quicksort(array, i_left, i_right):
-        if i_left < i_right:
+        if i_right - i_left < INSERTION_CUTOFF:  # short, finish by kernel
+            small_sort(array, i_left, i_right + 1)
+        else:
             i_pivot = random.randint(i_left, i_right)  # choose a random pivot
             i_pivot_new = partition(array, i_left, i_right, i_pivot)
 
@@ -90,6 +575,144 @@ def quick_sort(array):
     return array
 
 
+INSERTION_CUTOFF = 16  # slices not longer than this go to small_sort
+
+
+def median_of_three(array, a, b, c):
+    ''' index of the median one among array[a], array[b], array[c] '''
+    x, y, z = array[a], array[b], array[c]
+    if x < y:
+        if y < z:
+            return b
+        return c if x < z else a
+    if x < z:
+        return a
+    return c if y < z else b
+
+
+def choose_pivot(array, i_left, i_right):
+    '''
+    pivot index for array[i_left:i_right + 1]
+    median of three, or tukey's ninther (median of three medians) for big
+    slices, which is robust against sorted and organ-pipe inputs
+    '''
+    length = i_right - i_left + 1
+    mid = i_left + (length >> 1)
+    if length > 128:
+        s = length >> 3
+        return median_of_three(
+            array,
+            median_of_three(array, i_left, i_left + s, i_left + 2 * s),
+            median_of_three(array, mid - s, mid, mid + s),
+            median_of_three(array, i_right - 2 * s, i_right - s, i_right))
+    return median_of_three(array, i_left, mid, i_right)
+
+
+def partition3(array, i_left, i_right, pivot):
+    '''
+    3-way (dutch national flag) partition of array[i_left:i_right + 1]
+    return (lt, gt) that
+        array[i_left:lt] < pivot
+        array[lt:gt + 1] == pivot
+        array[gt + 1:i_right + 1] > pivot
+    '''
+    lt, i, gt = i_left, i_left, i_right
+    while i <= gt:
+        x = array[i]
+        if x < pivot:
+            array[i] = array[lt]
+            array[lt] = x
+            lt += 1
+            i += 1
+        elif pivot < x:
+            array[i] = array[gt]
+            array[gt] = x
+            gt -= 1
+        else:
+            i += 1
+    return lt, gt
+
+
+def heap_sort(array, i_left=0, i_right=None):
+    '''
+    in-place heap sort of array[i_left:i_right + 1]
+    T(n) = O(n*log(n)), no extra space
+    '''
+    if i_right is None:
+        i_right = len(array) - 1
+    base = i_left
+
+    def sift_down(i, length):
+        x = array[base + i]
+        child = 2 * i + 1
+        while child < length:
+            if child + 1 < length and \
+                    array[base + child] < array[base + child + 1]:
+                child += 1
+            if not x < array[base + child]:
+                break
+            array[base + i] = array[base + child]  # move the hole down
+            i = child
+            child = 2 * i + 1
+        array[base + i] = x
+
+    length = i_right - i_left + 1
+    for i in xrange(length // 2 - 1, -1, -1):
+        sift_down(i, length)
+    for end in xrange(length - 1, 0, -1):
+        array[base], array[base + end] = array[base + end], array[base]
+        sift_down(0, end)
+    return array
+
+
+def intro_sort(array, key=None, reverse=False):
+    '''
+    introsort, quick sort engine with bounded worst case
+    * pivot by median of three / ninther, 3-way partition for duplicates
+    * slices up to INSERTION_CUTOFF finish with small_sort kernels
+    * explicit stack, the smaller side is processed first, so the stack
+      never holds more than O(log(n)) ranges
+    * heap sort fallback once depth passes 2*log(n)
+    worst case: T(n) = O(n*log(n))
+    '''
+    if key is not None or reverse:
+        return sort_by(array, key, reverse)
+    length = len(array)
+    if length < 2:
+        return array
+    max_depth = 2 * int(math.log(length, 2))
+    stack = [(0, length - 1, 0)]
+    while stack:
+        i_left, i_right, depth = stack.pop()
+        while i_right - i_left >= INSERTION_CUTOFF:
+            if depth > max_depth:  # bad pivots, go for heap sort
+                heap_sort(array, i_left, i_right)
+                break
+            depth += 1
+            pivot = array[choose_pivot(array, i_left, i_right)]
+            lt, gt = partition3(array, i_left, i_right, pivot)
+            # defer the bigger side, keep working on the smaller one
+            if lt - i_left < i_right - gt:
+                stack.append((gt + 1, i_right, depth))
+                i_right = lt - 1
+            else:
+                stack.append((i_left, lt - 1, depth))
+                i_left = gt + 1
+        else:
+            small_sort(array, i_left, i_right + 1)
+    return array
+
+
+def quick_sort(array, key=None, reverse=False):
+    '''
+    in-place quick sort, by intro_sort: 3-way partition keeps duplicate
+    keys linear, the explicit stack and heap sort fallback keep the
+    recursion limit out of reach
+    worst case: T(n) = O(n*log(n))
+    '''
+    return intro_sort(array, key, reverse)
+
+
 def quick_sort2(array):
     '''
     simple quick sort version, need more mem
@@ -101,15 +724,22 @@ def quick_sort2(array):
         quick_sort2([gt for gt in array[1:] if gt > array[0]])
 
 
+SPARSE_RATIO = 4  # key range wider than this times n is a sparse domain
+
+
 def counting_sort(array):
     ''' counting sort
         T(n) = O(n)
-        but need a huge array if range(min, max) is very large
+        but need a huge array if range(min, max) is very large, so a sparse
+        domain is counted by sparse_counting_sort instead
     '''
-    # init a empty aux array
-    m = max(array)
-    n = min(array)
+    if len(array) < 2:
+        return array
+    n, m = list_range(array)
+    if m - n + 1 > SPARSE_RATIO * len(array):
+        return sparse_counting_sort(array)
 
+    # init a empty aux array
     aux = [0] * (m - n + 1)
     for a in array:  # get counting map
         aux[a - n] += 1
@@ -128,73 +758,350 @@ def counting_sort(array):
     return ret
 
 
+def sparse_counting_sort(array, runs=False):
+    '''
+    counting sort in a hash map, only distinct keys get a counter
+    paras:
+        runs -- return run length form [(value, count)] in value order,
+                for callers that only need the histogram
+    T(n) = O(n + d*log(d)), memory O(d), d is the number of distinct keys
+    '''
+    counts = {}
+    get = counts.get
+    for a in array:  # get counting map
+        counts[a] = get(a, 0) + 1
+    keys = intro_sort(counts.keys())
+    if runs:
+        return [(k, counts[k]) for k in keys]
+    ret = []
+    for k in keys:
+        ret.extend(repeat(k, counts[k]))
+    return ret
+
+
+def csort(array, shift, mask, offset=0):
+    '''
+    another type of counting sort.
+    picked by digit ((a - offset) >> shift) & mask, stable
+    '''
+    # init a empty aux array
+
+    aux = [0] * (mask + 1)
+    for a in array:  # get counting map
+        index = ((a - offset) >> shift) & mask
+        aux[index] += 1
+
+    # generate index map of aux
+    s = 0
+    for i in xrange(len(aux)):
+        s += aux[i]
+        aux[i] = s
+
+    ret = [0] * len(array)
+    for a in array[::-1]:  # reverse iter make sure the order
+        i = ((a - offset) >> shift) & mask
+        ret[aux[i] - 1] = a
+        aux[i] -= 1
+    return ret
+
+
 def radix_sort(array):
     ''' radix sort
         a branch of counting sort
+        keys are biased by the min, so negative and big ints are fine
         T(n) = O(n)
     '''
-    def csort(array, shift, mask):
-        '''
-        another type of counting sort.
-        picked by shift
-        '''
-        # init a empty aux array
-
-        aux = [0] * (mask + 1)
-        for a in array:  # get counting map
-            index = (a >> shift) & mask
-            aux[index] += 1
-
-        # generate index map of aux
-        s = 0
-        for i in xrange(len(aux)):
-            s += aux[i]
-            aux[i] = s
-
-        ret = [0] * len(array)
-        for a in array[::-1]:  # reverse iter make sure the order
-            i = (a >> shift) & mask
-            ret[aux[i] - 1] = a
-            aux[i] -= 1
-        return ret
-
-    r = int(math.log(len(array), 2))  # slicer
-    b = int(math.ceil(math.log(max(array), 2)))  # max bits
+    if len(array) < 2:
+        return array
+    n, m = list_range(array)
+    r = max(int(math.log(len(array), 2)), 1)  # slicer
+    b = (m - n).bit_length()  # max bits after bias
     mask = (2 ** r) - 1
-    for i in xrange(int(b / r) + 1):
-        shift = i * r
-        array = csort(array, shift, mask)
+    for shift in xrange(0, b, r):
+        array = csort(array, shift, mask, n)
+    return array
+
+
+MSD_CUTOFF = 32  # MSD buckets up to this size go to insertion sort
+
+
+def msd_radix_sort(array, cutoff=MSD_CUTOFF):
+    '''
+    MSD radix sort for byte strings, or (byte string, value) pairs
+    unicode is sorted by its utf-8 bytes (same order as code points); mixed
+    with unicode, byte strings are ordered by their raw bytes, they are not
+    decoded
+    strings are bucketed by their byte at depth d, 256 buckets plus one
+    for strings ending before d, buckets are refined at depth d + 1 until
+    they are small enough for insertion sort
+    stable and in place, one aux list of n, pairs are ordered by their
+    byte string only
+    T(n) = O(total bytes examined)
+    '''
+    length = len(array)
+    if length < 2:
+        return array
+    if any(isinstance(s, unicode) for s in array):
+        pairs = [(s.encode('utf-8') if isinstance(s, unicode) else s, s)
+                 for s in array]
+        msd_radix_sort(pairs, cutoff)  # tuples: byte keys decide the order
+        array[:] = [s for k, s in pairs]
+        return array
+    pairs = isinstance(array[0], tuple)
+
+    aux = [None] * length
+    stack = [(0, length, 0)]
+    while stack:
+        lo, hi, d = stack.pop()
+        if hi - lo <= cutoff:
+            # common prefix of length d, a comparison sort is cheaper
+            if not pairs:
+                binary_insert_sort(array, lo, hi, lo + 1)
+                continue
+            # binary insertion by the byte string alone, values may not
+            # even be comparable
+            for i in xrange(lo + 1, hi):
+                x = array[i]
+                key, l, r = x[0], lo, i
+                while l < r:
+                    m = (l + r) >> 1
+                    if key < array[m][0]:
+                        r = m
+                    else:
+                        l = m + 1
+                if l < i:
+                    array[l + 1:i + 1] = array[l:i]
+                    array[l] = x
+            continue
+        # count[0] is for strings ending before d, count[c + 1] for byte c
+        count = [0] * 258
+        for i in xrange(lo, hi):
+            s = array[i][0] if pairs else array[i]
+            count[ord(s[d]) + 2 if d < len(s) else 1] += 1
+        for c in xrange(1, 258):  # start of every bucket
+            count[c] += count[c - 1]
+        for i in xrange(lo, hi):
+            x = array[i]
+            s = x[0] if pairs else x
+            c = ord(s[d]) + 1 if d < len(s) else 0
+            aux[lo + count[c]] = x
+            count[c] += 1
+        array[lo:hi] = aux[lo:hi]
+        # count[c] is now the end of bucket c
+        for c in xrange(1, 257):
+            start, end = lo + count[c - 1], lo + count[c]
+            if end - start > 1:
+                stack.append((start, end, d + 1))
+    return array
+
+
+SIGN_BIT = 1 << 63
+MASK64 = (1 << 64) - 1
+
+
+def float_to_key(x):
+    '''
+    order preserving map of an IEEE-754 double to a 64-bit unsigned int:
+    flip the sign bit of positives, all bits of negatives
+    '''
+    u = struct.unpack('>Q', struct.pack('>d', x))[0]
+    return u ^ MASK64 if u & SIGN_BIT else u | SIGN_BIT
+
+
+def key_to_float(k):
+    ''' inverse of float_to_key '''
+    u = k ^ SIGN_BIT if k & SIGN_BIT else k ^ MASK64
+    return struct.unpack('>d', struct.pack('>Q', u))[0]
+
+
+def float_radix_sort(array):
+    '''
+    radix sort for floats, negatives and infinities included
+    floats are mapped to int keys by float_to_key, sorted by the LSD
+    radix_sort (csort passes), then mapped back; -0.0 sorts before 0.0
+    T(n) = O(n * 64 / log(n))
+    '''
+    if len(array) < 2:
+        return array
+    keys = radix_sort([float_to_key(x) for x in array])
+    array[:] = [key_to_float(k) for k in keys]
     return array
 
 
-def bucket_sort(array, size=10):
+def as_int_vector(array):
+    '''
+    convert array to a numpy integer vector, at most one copy
+    array -- list, array.array or numpy array of integers
+    return (vector, wrap), wrap turns a result vector back into the
+    container type of the input
+    '''
+    if numpy is None:
+        raise ImportError('vectorized sort needs numpy')
+    if isinstance(array, numpy.ndarray):
+        vector, wrap = array, lambda v: v
+    elif isinstance(array, pyarray.array):
+        typecode = array.typecode
+        # zero copy view on the buffer
+        vector = numpy.frombuffer(array, dtype=numpy.dtype(typecode)) \
+            if len(array) else numpy.array([], dtype=numpy.dtype(typecode))
+        wrap = lambda v: pyarray.array(typecode, v.tostring())
+    else:
+        vector = numpy.array(array)
+        if not len(vector):
+            vector = vector.astype(numpy.int64)
+        wrap = lambda v: v.tolist()
+    if vector.dtype.kind not in 'iu':
+        raise TypeError('integer keys expected, got %s' % vector.dtype)
+    return vector, wrap
+
+
+def counting_sort_vec(array):
+    '''
+    vectorized counting sort, numpy is required
+    histogram by bincount, then expand each key by its count
+    array -- list, array.array or numpy integer array, negatives allowed
+    return sorted keys in the same container type
+    T(n) = O(n + max - min), all in bulk array operations
+    '''
+    keys, wrap = as_int_vector(array)
+    if len(keys) < 2:
+        return wrap(keys.copy())
+    n, m = keys.min(), keys.max()
+    # widen before the bias, narrow key types would overflow
+    counts = numpy.bincount(keys.astype(numpy.int64) - n.astype(numpy.int64))
+    # values n..m, wrapping arithmetic in the key type is exact here
+    values = numpy.arange(len(counts)).astype(keys.dtype) + n
+    return wrap(numpy.repeat(values, counts))
+
+
+# numpy 1.17 and later run a stable sort of 16-bit ints as a C radix sort,
+# i.e. histogram, prefix sum and scatter; before that it is a merge sort
+RADIX_ARGSORT = numpy is not None and \
+    tuple(int(v) for v in numpy.__version__.split('.')[:2]) >= (1, 17)
+
+
+def radix_sort_vec(array, bits=16):
+    '''
+    vectorized LSD radix sort, numpy is required
+    keys are mapped to uint64 with order kept (sign bit flipped for signed
+    types) and biased by the min, so negatives and full 64-bit ranges work
+    and only the significant digits get a pass
+    every pass is a stable argsort of one bits-wide digit, a counting sort
+    in C on numpy >= 1.17; older numpy has no bulk stable scatter, so there
+    the keys go to numpy.sort in one go instead of a merge sort per pass
+    array -- list, array.array or numpy integer array
+    bits -- digit width, at most 16
+    return sorted keys in the same container type
+    '''
+    keys, wrap = as_int_vector(array)
+    if len(keys) < 2:
+        return wrap(keys.copy())
+    if not RADIX_ARGSORT:
+        return wrap(numpy.sort(keys, kind='stable'))
+    dtype = keys.dtype
+    sign = numpy.uint64(1 << 63)
+    if dtype.kind == 'i':
+        ukeys = keys.astype(numpy.int64).view(numpy.uint64) ^ sign
+    else:
+        ukeys = keys.astype(numpy.uint64)
+    low = ukeys.min()
+    ukeys -= low
+    span = int(ukeys.max()).bit_length()
+    mask = numpy.uint64((1 << bits) - 1)
+    for shift in xrange(0, span, bits):
+        digits = ((ukeys >> numpy.uint64(shift)) & mask).astype(numpy.uint16)
+        # histogram, prefix sum and stable scatter of the digits, in C
+        ukeys = ukeys[numpy.argsort(digits, kind='stable')]
+    ukeys += low
+    if dtype.kind == 'i':
+        ukeys = (ukeys ^ sign).view(numpy.int64)
+    return wrap(ukeys.astype(dtype))
+
+
+BUCKET_SAMPLE = 1024  # keys sampled to detect a skewed distribution
+BUCKET_SKEW = 4  # a coarse bin over this times its fair share is skewed
+
+
+def bucket_sort(array, size=None, key=None):
     ''' bucker sort T(n) = O(n)
     para:
-        array -- list to be sorted
-        size -- size of bucket, default is 10
-    need array to randomized distribute
+        array -- list to be sorted, ints or floats
+        size -- number of buckets, default is len(array)
+        key -- key function, keys are computed once, the sort is stable
+    buckets split the measured range evenly, if a sample shows the keys
+    are badly skewed, buckets are split at sampled quantiles instead
+    sort in place, extra memory O(n)
     '''
+    length = len(array)
+    if length < 2:
+        return array
+    keys = array if key is None else [key(x) for x in array]
+
+    # here we want to build a generic bucket sort apply to any numbers, so
+    # need to figure out the range of the array
+    n, m = list_range(keys)
+    if n == m:  # all keys equal, nothing to do
+        return array
+    size = size or length
+
     # init empty buckets
     # should not use [[]] * size, because inner [] refer to the same empty
     # list, so each insert to that list would apply to all lists
     buckets = [[] for i in xrange(size)]
-
-    # here we want to build a generic bucket sort apply to any intergers, so
-    # need to figure out the range of the array
-    n, m = list_range(array)
-    stride = int(math.ceil((m - n) / float(size)))  # need a ceil here
+    last = size - 1
+    scale = size / float(m - n)
+    splitters = bucket_splitters(keys, n, m, size)
+    # a bucket holds elements, or (key, index) pairs with a key function
+    items = array if key is None else \
+        [(k, i) for i, k in enumerate(keys)]
 
     # fill in the buckets
-    for i in array:
-        index = int((i - n) / stride)  # choose which bucket to append
-        buckets[index].append(i)
+    if splitters is None:
+        for k, item in izip(keys, items):
+            index = int((k - n) * scale)  # choose which bucket to append
+            buckets[index if index < last else last].append(item)
+    else:
+        bisect_right = bisect.bisect_right
+        for k, item in izip(keys, items):
+            buckets[bisect_right(splitters, k)].append(item)
 
-    # sort elements in each bucket
-    for bucket in buckets:
-        insert_sort(bucket)
+    # sort elements in each bucket, and write back in order
+    if key is None:
+        pos = 0
+        for bucket in buckets:
+            if len(bucket) <= INSERTION_CUTOFF:
+                small_sort(bucket, 0, len(bucket))
+            else:
+                merge_sort(bucket)
+            array[pos:pos + len(bucket)] = bucket
+            pos += len(bucket)
+    else:
+        order = []
+        for bucket in buckets:
+            merge_sort(bucket)  # index breaks ties, so stable
+            order.extend(i for k, i in bucket)
+        array[:] = [array[i] for i in order]
+    return array
 
-    # concate each buckets into one array, and return
-    return sum(buckets, [])
+
+def bucket_splitters(keys, n, m, size):
+    '''
+    None if a sample of keys spreads fairly over range [n, m], otherwise
+    sorted sample quantiles to split buckets at
+    '''
+    length = len(keys)
+    if length <= BUCKET_SAMPLE:
+        return None
+    sample = [keys[i] for i in random.sample(xrange(length), BUCKET_SAMPLE)]
+    bins = [0] * 32
+    scale = 32 / float(m - n)
+    for k in sample:
+        bins[min(int((k - n) * scale), 31)] += 1
+    if max(bins) <= BUCKET_SKEW * BUCKET_SAMPLE / 32:
+        return None
+    merge_sort(sample)
+    nbucket = min(size, BUCKET_SAMPLE)
+    return [sample[BUCKET_SAMPLE * i // nbucket] for i in xrange(1, nbucket)]
 
 
 def list_range(array):
@@ -251,3 +1158,272 @@ def randomize_select(array, n):
     index = func(array, 0, length - 1, n - 1)
 
     return array[index]
+
+
+def median_of_medians(array, i_left, i_right):
+    '''
+    pivot value of array[i_left:i_right + 1] by median of medians of five
+    the pivot always has at least 3/10 of the elements on each side
+    '''
+    medians = []
+    for i in xrange(i_left, i_right + 1, 5):
+        group = binary_insert_sort(array[i:min(i + 5, i_right + 1)], 0,
+                                   min(5, i_right + 1 - i), 1)
+        medians.append(group[(len(group) - 1) >> 1])
+    return select_range(medians, 0, len(medians) - 1, (len(medians) - 1) >> 1)
+
+
+def select_range(array, i_left, i_right, k):
+    '''
+    introselect, move the kth (absolute index) smallest element of
+    array[i_left:i_right + 1] to array[k] and return it
+    quick select with 3-way partition, after too many partitions that keep
+    more than 3/4 of the range, pivots come from median of medians
+    '''
+    budget = 2 * (i_right - i_left + 1).bit_length()
+    while i_right - i_left >= INSERTION_CUTOFF:
+        if budget > 0:
+            pivot = array[choose_pivot(array, i_left, i_right)]
+        else:
+            pivot = median_of_medians(array, i_left, i_right)
+        size = i_right - i_left
+        lt, gt = partition3(array, i_left, i_right, pivot)
+        if k < lt:
+            i_right = lt - 1
+        elif k > gt:
+            i_left = gt + 1
+        else:
+            return pivot
+        if i_right - i_left > size * 3 // 4:  # bad split
+            budget -= 1
+    binary_insert_sort(array, i_left, i_right + 1, i_left + 1)
+    return array[k]
+
+
+def intro_select(array, n, inplace=True):
+    '''
+    find out the nth small element of a array, duplicates are fine
+    paras:
+        n -- index start from 1
+        inplace -- False to work on a copy and leave array unmodified
+    worst case: T(n) = O(n)
+    '''
+    length = len(array)
+    if not 1 <= n <= length:
+        raise IndexError('rank %s out of range' % n)
+    if not inplace:
+        array = list(array)
+    return select_range(array, 0, length - 1, n - 1)
+
+
+def multiselect(array, ranks, inplace=True):
+    '''
+    many order statistics in one partition pass
+    every partition splits the pending ranks between its two sides, so
+    ranges holding no rank are never touched again
+    paras:
+        ranks -- indexes start from 1, like intro_select
+        inplace -- False to work on a copy and leave array unmodified
+    return elements of the ranks, in order of ranks
+    T(n) = O(n*log(len(ranks)))
+    '''
+    length = len(array)
+    pending = sorted(set(r - 1 for r in ranks))
+    if pending and (pending[0] < 0 or pending[-1] >= length):
+        raise IndexError('rank out of range')
+    if not inplace:
+        array = list(array)
+    found = {}
+    max_depth = 2 * length.bit_length()
+    stack = [(0, length - 1, pending, 0)] if pending else []
+    while stack:
+        i_left, i_right, pending, depth = stack.pop()
+        if len(pending) == 1:
+            found[pending[0]] = select_range(array, i_left, i_right,
+                                             pending[0])
+            continue
+        if i_right - i_left < INSERTION_CUTOFF:
+            binary_insert_sort(array, i_left, i_right + 1, i_left + 1)
+            for k in pending:
+                found[k] = array[k]
+            continue
+        if depth < max_depth:
+            pivot = array[choose_pivot(array, i_left, i_right)]
+        else:
+            pivot = median_of_medians(array, i_left, i_right)
+        lt, gt = partition3(array, i_left, i_right, pivot)
+        i = bisect.bisect_left(pending, lt)
+        j = bisect.bisect_right(pending, gt)
+        for k in pending[i:j]:
+            found[k] = pivot
+        if i:
+            stack.append((i_left, lt - 1, pending[:i], depth + 1))
+        if j < len(pending):
+            stack.append((gt + 1, i_right, pending[j:], depth + 1))
+    return [found[r - 1] for r in ranks]
+
+
+def argsort(array, key=None, reverse=False):
+    '''
+    index permutation that sorts array, array itself is not changed
+    keys are computed once into a parallel list, which merge_sort sorts
+    bare, then every key object is mapped back to its index by its id;
+    an object standing for several indexes gives them in input order, as
+    merge_sort is stable, so no (key, index) pairs are built or compared
+    a descending sort is done ascending on the reversed keys, then
+    reversed back: equal keys keep their order
+    T(n) = O(n*log(n)) compares of bare keys, O(n) to map them back
+    '''
+    keys = list(array) if key is None else [key(x) for x in array]
+    n = len(keys)
+    if reverse:
+        keys.reverse()
+    where = dict(izip(imap(id, keys), xrange(n)))
+    if len(where) == n:  # distinct key objects, the common case
+        merge_sort(keys)
+        order = map(where.__getitem__, imap(id, keys))
+    else:  # shared objects, e.g. small ints: chain the indexes of each
+        first, chain = {}, [-1] * n
+        for i in xrange(n - 1, -1, -1):
+            k = id(keys[i])
+            chain[i] = first.get(k, -1)
+            first[k] = i
+        merge_sort(keys)
+        order = []
+        for x in keys:
+            k = id(x)
+            i = first[k]
+            first[k] = chain[i]
+            order.append(i)
+    if reverse:
+        order.reverse()
+        return [n - 1 - i for i in order]
+    return order
+
+
+def sort_by(array, key=None, reverse=False):
+    '''
+    keyed sort of array in place, stable like sorted()
+    elements are moved only once, by the permutation of argsort
+    '''
+    order = argsort(array, key, reverse)
+    result = [array[i] for i in order]
+    if isinstance(array, pyarray.array):  # takes back only its own type
+        result = pyarray.array(array.typecode, result)
+    array[:] = result
+    return array
+
+
+DISPATCH_SAMPLE = 128  # pairs and keys sampled by choose_sort
+SMALL_SORT = 64  # one binary insertion run of merge_sort covers this
+
+
+def choose_sort(array):
+    '''
+    pick a sort of this module for array from sampled statistics:
+    element type, key range (by list_range), estimated runs and inversions,
+    duplicate ratio of a sample
+    return (name, reason, stats)
+    '''
+    length = len(array)
+    stats = {'n': length}
+    # typed buffers first: merge_sort merges through list slices, which an
+    # array.array does not take back
+    if isinstance(array, pyarray.array) or \
+            (numpy is not None and isinstance(array, numpy.ndarray)):
+        if numpy is not None and length > 1 and numpy.dtype(
+                getattr(array, 'typecode', None) or array.dtype).kind in 'iu':
+            if isinstance(array, numpy.ndarray):
+                n, m = int(array.min()), int(array.max())
+            else:
+                n, m = list_range(array)
+            span = stats['range'] = m - n + 1
+            if span <= 2 * length:
+                return 'counting_sort_vec', \
+                    'integer buffer, key range %d within 2n' % span, stats
+            return 'radix_sort_vec', 'integer buffer', stats
+        return 'intro_sort', 'typed buffer, sorted in place', stats
+    if length <= SMALL_SORT:
+        return 'merge_sort', 'small input, one insertion sorted run', stats
+
+    # presortedness: descents of sampled adjacent pairs estimate the runs,
+    # order of sampled random pairs estimates the inversions
+    count = min(DISPATCH_SAMPLE, length - 1)
+    picks = random.sample(xrange(length - 1), count)
+    descents = sum(1 for i in picks if array[i + 1] < array[i])
+    # a descending run is as good as an ascending one for merge_sort
+    stats['runs'] = min(descents, count - descents) * length // count + 1
+    inversions = 0
+    for t in xrange(count):
+        i, j = sorted(random.sample(xrange(length), 2))
+        inversions += array[j] < array[i]
+    stats['inversions'] = inversions * length * (length - 1) // (2 * count)
+    if descents * 32 <= count or (count - descents) * 32 <= count:
+        return 'merge_sort', \
+            'presorted, about %d runs' % stats['runs'], stats
+
+    sample = [array[i] for i in picks]
+    try:
+        stats['duplicates'] = 1 - len(set(sample)) / float(count)
+    except TypeError:  # unhashable elements
+        stats['duplicates'] = None
+
+    integer = all(isinstance(x, (int, long)) for x in sample) and \
+        all(isinstance(x, (int, long)) for x in array)
+    if integer:
+        n, m = list_range(array)
+        span = stats['range'] = m - n + 1
+        if span <= 2 * length:
+            return 'counting_sort', 'key range %d within 2n' % span, stats
+        passes = -(-span.bit_length() // int(math.log(length, 2)))
+        if passes <= 3:
+            return 'radix_sort', \
+                'key range %d, %d radix passes' % (span, passes), stats
+    if stats['duplicates'] is not None and stats['duplicates'] >= 0.5:
+        return 'intro_sort', \
+            'duplicate ratio %.2f, 3-way partition' % stats['duplicates'], \
+            stats
+    if isinstance(sample[0], (int, long, float)):
+        return 'intro_sort', 'numbers in random order', stats
+    # comparisons of general objects are expensive, merge_sort does fewest
+    return 'merge_sort', 'objects in random order', stats
+
+
+def sort(array, trace=None):
+    '''
+    sort array in place with the algorithm choose_sort picks
+    paras:
+        trace -- callback(name, reason, stats), to audit the decision
+    '''
+    name, reason, stats = choose_sort(array)
+    if trace is not None:
+        trace(name, reason, stats)
+    result = globals()[name](array)
+    if result is not array:  # counting and radix sorts build a new list
+        array[:] = result
+    return array
+
+
+# cutoffs bench.py tune measures, and saves to TUNING_FILE
+TUNABLE = ('INSERTION_CUTOFF', 'MIN_MERGE')
+TUNING_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'tuning.json')
+
+
+def load_tuning(path=TUNING_FILE):
+    '''
+    override the TUNABLE cutoffs with values tuned on this machine
+    return the values loaded, empty if there is no tuning file
+    '''
+    try:
+        with open(path) as f:
+            values = json.load(f)
+    except (IOError, ValueError):
+        return {}
+    for name in TUNABLE:
+        if name in values:
+            globals()[name] = int(values[name])
+    return values
+
+
+load_tuning()
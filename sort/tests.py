@@ -10,7 +10,11 @@ class TestSort(unittest.TestCase):
         self.funcs = ['insert_sort',
                       'insert_sort2',
                       'merge_sort',
+                      'inplace_merge_sort',
                       'quick_sort',
+                      'quick_sort_recursive',
+                      'intro_sort',
+                      'heap_sort',
                       'counting_sort',
                       'radix_sort',
                       'bucket_sort',
@@ -46,6 +50,482 @@ class TestSort(unittest.TestCase):
         random.shuffle(array)
         self.check_sorted(sort.bucket_sort(array))
 
+    def test_merge_sort(self):
+        class Item(object):
+            ''' compare by key only, to check stability '''
+            def __init__(self, key, tag):
+                self.key, self.tag = key, tag
+
+            def __lt__(self, other):
+                return self.key < other.key
+
+        pairs = [(random.randint(0, 50), i) for i in range(3000)]
+        items = sort.merge_sort([Item(k, t) for k, t in pairs])
+        self.assertListEqual([(x.key, x.tag) for x in items],
+                             sorted(pairs, key=lambda p: p[0]))
+
+        # presorted, reversed and partial runs, no deep recursion involved
+        array = range(100000)
+        self.assertListEqual(sort.merge_sort(deepcopy(array)), array)
+        self.assertListEqual(sort.merge_sort(array[::-1]), array)
+        runs = array[50000:] + array[:50000]
+        self.assertListEqual(sort.merge_sort(runs), array)
+        self.assertListEqual(sort.merge_sort([]), [])
+
+        # buffer free variant: stable, and nothing sliced out of the array
+        from instrument import Collector
+        items = [Item(k, t) for k, t in pairs]
+        stats = Collector().run(sort.inplace_merge_sort, items)
+        self.assertListEqual([(x.key, x.tag) for x in items],
+                             sorted(pairs, key=lambda p: p[0]))
+        self.assertEqual(stats['allocations'], 0)
+
+    def test_small_sort(self):
+        import itertools
+        # 0-1 principle: a network sorting every 0/1 input sorts anything
+        cases = [list(bits) for n in range(9)
+                 for bits in itertools.product((0, 1), repeat=n)]
+        # binary insertion above 8
+        cases += [[random.randint(0, 5) for i in range(n)]
+                  for n in (9, 10, 16, 33) for trial in range(50)]
+        for array in cases:
+            array = [-1] + array + [-2]
+            expect = array[:1] + sorted(array[1:-1]) + array[-1:]
+            self.assertListEqual(sort.small_sort(array, 1, len(array) - 1),
+                                 expect)
+
+        saved = sort.INSERTION_CUTOFF, sort.MIN_MERGE
+        try:
+            sort.INSERTION_CUTOFF, sort.MIN_MERGE = 40, 16
+            array = [random.randint(0, 100) for i in range(3000)]
+            for func in ('quick_sort', 'intro_sort', 'merge_sort'):
+                self.assertListEqual(self.get_func(func)(deepcopy(array)),
+                                     sorted(array))
+        finally:
+            sort.INSERTION_CUTOFF, sort.MIN_MERGE = saved
+
+    def test_intro_sort(self):
+        # many duplicate keys, and big enough to overflow the recursion
+        # limit of a recursive quick sort on sorted input
+        array = [random.randint(0, 3) for i in range(20000)]
+        self.assertListEqual(sort.intro_sort(deepcopy(array)), sorted(array))
+        array = range(20000)
+        self.assertListEqual(sort.intro_sort(array[::-1]), array)
+        organ = range(5000) + range(5000, 0, -1)
+        self.assertListEqual(sort.intro_sort(deepcopy(organ)), sorted(organ))
+        # quick_sort is the same engine
+        array = [random.randint(0, 2) for i in range(5000)]
+        self.assertListEqual(sort.quick_sort(deepcopy(array)), sorted(array))
+        self.assertListEqual(sort.quick_sort(range(20000, 0, -1)),
+                             range(1, 20001))
+
+        # heap sort is also the fallback for a sub range
+        array = [5, 4, 3, 2, 1, 0]
+        self.assertListEqual(sort.heap_sort(array, 1, 4), [5, 1, 2, 3, 4, 0])
+
+    def test_key_reverse(self):
+        records = [(random.randint(0, 20), i) for i in range(300)]
+        calls = []
+
+        def key(record):
+            calls.append(record)
+            return record[0]
+
+        for func in ('insert_sort', 'insert_sort2', 'merge_sort',
+                     'quick_sort', 'intro_sort'):
+            for reverse in (False, True):
+                expect = sorted(records, key=key, reverse=reverse)
+                del calls[:]
+                result = self.get_func(func)(deepcopy(records), key=key,
+                                             reverse=reverse)
+                self.assertListEqual(result, expect)
+                self.assertEqual(len(calls), len(records))  # key once each
+            self.assertListEqual(self.get_func(func)([3, 1, 2], reverse=True),
+                                 [3, 2, 1])
+
+        array = [30, 10, 20, 10]
+        self.assertListEqual(sort.argsort(array), [1, 3, 2, 0])
+        self.assertListEqual(sort.argsort(array, reverse=True), [0, 2, 1, 3])
+        self.assertListEqual(array, [30, 10, 20, 10])
+        # equal keys as distinct objects, and as one shared object
+        for make in (lambda r: float(r[0] % 5), lambda r: r[0] % 5):
+            for reverse in (False, True):
+                expect = sorted(records, key=make, reverse=reverse)
+                self.assertListEqual(sort.merge_sort(deepcopy(records),
+                                                     key=make,
+                                                     reverse=reverse), expect)
+        import array as pyarray
+        buf = pyarray.array('d', [2.5, -1.0, 3.0, 0.5])
+        self.assertListEqual(sort.intro_sort(buf, key=abs).tolist(),
+                             [0.5, -1.0, 2.5, 3.0])
+
+    def test_bucket_sort(self):
+        self.assertListEqual(sort.bucket_sort([5, 5, 5]), [5, 5, 5])
+        array = [random.uniform(-1, 1) for i in range(3000)]
+        self.assertListEqual(sort.bucket_sort(deepcopy(array)), sorted(array))
+        # skewed: most keys in a tiny part of the range
+        array = [int(random.paretovariate(0.3)) for i in range(5000)]
+        self.assertListEqual(sort.bucket_sort(deepcopy(array)), sorted(array))
+        records = [(random.random() * 10, i) for i in range(2000)]
+        self.assertListEqual(sort.bucket_sort(deepcopy(records), size=7,
+                                              key=lambda r: int(r[0])),
+                             sorted(records, key=lambda r: int(r[0])))
+
+    def test_dispatch(self):
+        cases = [
+            (range(1000), 'merge_sort'),
+            (range(1000, 0, -1), 'merge_sort'),
+            ([random.randint(0, 100) for i in range(1000)], 'counting_sort'),
+            ([random.randint(0, 10 ** 6) for i in range(1000)], 'radix_sort'),
+            ([random.randint(0, 2) * 0.5 for i in range(1000)], 'intro_sort'),
+            ([str(random.random()) for i in range(1000)], 'merge_sort'),
+        ]
+        for array, name in cases:
+            decisions = []
+            trace = lambda *args: decisions.append(args)
+            expect = sorted(array)
+            self.assertTrue(sort.sort(array, trace=trace) is array)
+            self.assertListEqual(array, expect)
+            self.assertEqual(decisions[0][0], name, decisions)
+            self.assertEqual(decisions[0][2]['n'], 1000)
+        self.assertEqual(sort.choose_sort([2, 1])[0], 'merge_sort')
+
+        # presorted typed buffers, merge_sort cannot write them back
+        import array
+        for typecode, keys in (('l', range(2500, 5000) + range(2500)),
+                               ('d', [x * 0.5 for x in range(5000)])):
+            buf = array.array(typecode, keys)
+            self.assertTrue(sort.sort(buf) is buf)
+            self.assertListEqual(buf.tolist(), sorted(keys))
+        buf = array.array('d', [3.0, 1.0, 2.0])
+        self.assertListEqual(sort.sort(buf).tolist(), [1.0, 2.0, 3.0])
+
+    def test_instrument(self):
+        import os
+        import sys
+        from instrument import Collector
+        array = range(2000)
+        random.shuffle(array)
+        seen = []
+        stats = Collector(seen.append).run(sort.quick_sort_recursive, array)
+        self.assertListEqual(array, range(2000))
+        self.assertListEqual(seen, [stats])
+        self.assertTrue(stats['comparisons'] > 2000)
+        self.assertTrue(stats['partitions'] > 0)
+        self.assertTrue(1 < stats['max_depth'] < 100)
+        self.assertFalse(sort.partition.__name__ == 'wrapper')  # restored
+
+        stats = Collector().run(sort.merge_sort, array[::-1])
+        self.assertTrue(stats['moves'] > 0 and stats['allocations'] > 0)
+        stats = Collector().run(sort.counting_sort, [3, 1, 2])
+        self.assertEqual(stats['comparisons'], None)
+        # the key sees bare elements, the sort runs once
+        records = [(random.randint(0, 50), i) for i in range(300)]
+        calls = []
+        key = lambda r: calls.append(r) or r[0]
+        stats = Collector().run(sort.merge_sort, records, key=key)
+        self.assertTrue(stats['comparisons'] > 300)
+        self.assertEqual(len(calls), 300)
+        self.assertListEqual(records, sorted(records, key=lambda r: r[0]))
+        # other type errors are not taken for arithmetic sorts
+        self.assertRaises(TypeError, Collector().run, sort.merge_sort,
+                          records, key=lambda r: r[0] + '')
+
+        sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                        'heap'))
+        from heap import Heap
+        collector = Collector()
+        with collector.enabled(Heap):
+            Heap(array).sort()
+        self.assertTrue(collector.as_dict()['heapify'] > 2000)
+        collector.reset()
+        Heap(array).sort()
+        self.assertEqual(collector.as_dict()['heapify'], 0)
+
+        # queue operations sift through the hooked methods too
+        from heap import PriorityQueue
+        queue = PriorityQueue(array)
+        with collector.enabled(Heap):
+            for i in range(500):
+                queue.pop_top()
+            queue.insert_key(-1)
+            queue.update_key(1, 5000)
+        self.assertEqual(collector.as_dict()['heapify'], 502)
+
+    def test_select(self):
+        array = [random.randint(0, 30) for i in range(2000)]
+        ordered = sorted(array)
+        copy = deepcopy(array)
+        for n in (1, 7, 1000, 1999, 2000):
+            self.assertEqual(sort.intro_select(array, n, inplace=False),
+                             ordered[n - 1])
+        self.assertListEqual(array, copy)  # untouched
+        self.assertEqual(sort.intro_select(array, 1500), ordered[1499])
+        self.assertRaises(IndexError, sort.intro_select, array, 2001)
+
+        array = range(10000)
+        random.shuffle(array)
+        ranks = [5000, 9000, 9900, 9990, 1]  # p50, p90, p99, p999, min
+        self.assertListEqual(sort.multiselect(array, ranks, inplace=False),
+                             [r - 1 for r in ranks])
+        self.assertListEqual(sort.multiselect([3, 3, 1], [3, 1, 2]),
+                             [3, 1, 3])
+
+    def test_sparse_counting_sort(self):
+        # a dense aux list would take 10 ** 12 slots
+        array = [10 ** 12, 0, 5, 10 ** 12, 0, -3]
+        self.assertListEqual(sort.counting_sort(array),
+                             [-3, 0, 0, 5, 10 ** 12, 10 ** 12])
+        self.assertListEqual(sort.sparse_counting_sort(array, runs=True),
+                             [(-3, 1), (0, 2), (5, 1), (10 ** 12, 2)])
+        array = [random.randint(0, 50) for i in range(500)]
+        self.assertListEqual(sort.sparse_counting_sort(array), sorted(array))
+        self.assertListEqual(sort.counting_sort([]), [])
+
+    def test_sort_slices(self):
+        from asyncsort import sort_slices
+        pairs = [(random.randint(0, 20), i) for i in range(1000)]
+        array = deepcopy(pairs)
+        steps = sum(1 for step in sort_slices(array, unit=64))
+        self.assertListEqual(array, sorted(pairs))
+        self.assertTrue(steps > 1000 / 64)
+
+    def test_sort_async(self):
+        import asyncsort
+        asyncio = asyncsort.asyncio
+        if asyncio is None:
+            self.skipTest('no asyncio')
+        loop = asyncio.new_event_loop()
+        try:
+            ticks = []
+
+            def tick():  # another task, must keep running during the sort
+                ticks.append(1)
+                loop.call_soon(tick)
+
+            array = range(20000)
+            random.shuffle(array)
+            loop.call_soon(tick)
+            future = asyncsort.sort_async(array, budget_ms=1, loop=loop)
+            self.assertTrue(loop.run_until_complete(future) is array)
+            self.assertListEqual(array, range(20000))
+            self.assertTrue(len(ticks) > 5)
+
+            array = [random.random() for i in range(1000)]
+            expect = sorted(array)
+            future = asyncsort.sort_in_process(array, loop=loop)
+            self.assertListEqual(loop.run_until_complete(future), expect)
+            self.assertListEqual(array, expect)
+
+            future = asyncsort.sort_in_process([1, 'a'], 'radix_sort',
+                                               loop=loop)
+            self.assertRaises(RuntimeError, loop.run_until_complete, future)
+
+            big = range(300000, 0, -1)
+            future = asyncsort.sort_in_process(big, loop=loop)
+            for job in list(asyncsort.running):
+                job.kill()  # killed under the sort: fail, not hang
+            self.assertRaises(RuntimeError, loop.run_until_complete, future)
+
+            # a timeout kills its own process only
+            other = range(200000, 0, -1)
+            untimed = asyncsort.sort_in_process(other, loop=loop)
+            timed = asyncsort.sort_in_process(list(big), loop=loop,
+                                              timeout=0.001)
+            self.assertRaises(asyncio.TimeoutError, loop.run_until_complete,
+                              timed)
+            self.assertListEqual(loop.run_until_complete(untimed),
+                                 range(1, 200001))
+            future = asyncsort.sort_in_process([2, 1], loop=loop, timeout=30)
+            self.assertListEqual(loop.run_until_complete(future), [1, 2])
+        finally:
+            loop.close()
+
+    def test_setops(self):
+        import setops
+        from collections import Counter
+        for m, n in ((0, 10), (5, 1000), (300, 400), (1000, 7)):
+            a = sorted(random.randint(0, 500) for i in range(m))
+            b = sorted(random.randint(0, 500) for i in range(n))
+            ca, cb = Counter(a), Counter(b)
+            self.assertListEqual(setops.intersect(a, b),
+                                 sorted((ca & cb).elements()))
+            self.assertListEqual(setops.union(a, b),
+                                 sorted((ca | cb).elements()))
+            self.assertListEqual(setops.difference(a, b),
+                                 sorted((ca - cb).elements()))
+            self.assertListEqual(setops.difference(b, a),
+                                 sorted((cb - ca).elements()))
+        lists = [sorted(set(random.randint(0, 2000) for i in range(n)))
+                 for n in (50, 800, 1500)]
+        self.assertListEqual(setops.intersect_many(*lists),
+                             sorted(set(lists[0]) & set(lists[1]) &
+                                    set(lists[2])))
+        self.assertListEqual(setops.intersect_many(), [])
+
+        left = sorted((random.randint(0, 50), i) for i in range(200))
+        right = sorted((random.randint(0, 50), -i) for i in range(30))
+        first = lambda x: x[0]
+        expect = [(l, r) for l in left for r in right if l[0] == r[0]]
+        self.assertListEqual(list(setops.merge_join(left, right, first)),
+                             expect)
+
+        array = [random.randint(0, 20) for i in range(300)]
+        self.assertListEqual(setops.sort_unique(list(array)),
+                             sorted(set(array)))
+        array.sort()
+        runs = list(setops.group_runs(array))
+        self.assertListEqual([k for k, run in runs], sorted(set(array)))
+        self.assertListEqual(sum([run for k, run in runs], []), array)
+        runs = list(setops.group_runs(left, first))
+        self.assertListEqual([k for k, run in runs],
+                             sorted(set(map(first, left))))
+        self.assertListEqual(sum([run for k, run in runs], []), left)
+
+    def test_radix_sort(self):
+        # negative and 64-bit keys
+        array = [random.randint(-2 ** 63, 2 ** 63 - 1) for i in range(1000)]
+        self.assertListEqual(sort.radix_sort(deepcopy(array)), sorted(array))
+        self.assertListEqual(sort.radix_sort([3, -1, 0, -7]), [-7, -1, 0, 3])
+        self.assertListEqual(sort.radix_sort([1]), [1])
+
+    def test_string_float_radix(self):
+        ids = ['%x' % random.getrandbits(random.randint(1, 64))
+               for i in range(3000)] + ['', 'a', 'a', 'ab']
+        self.assertListEqual(sort.msd_radix_sort(deepcopy(ids)), sorted(ids))
+        self.assertListEqual(sort.msd_radix_sort(deepcopy(ids), cutoff=1),
+                             sorted(ids))
+        words = [u'\u4e2d', u'b', u'\xe9', u'', 'a']
+        self.assertListEqual(sort.msd_radix_sort(deepcopy(words)),
+                             sorted(words))
+        # non-ascii bytes next to unicode: raw bytes, not decoded
+        self.assertListEqual(sort.msd_radix_sort(['\xff', u'\xe9', 'a']),
+                             ['a', u'\xe9', '\xff'])
+
+        # stable on pairs, in small and large buckets alike
+        for n in (3, 40, 300):
+            records = [('ab'[random.randint(0, 1)] * 2, i)
+                       for i in range(n, 0, -1)]
+            self.assertListEqual(sort.msd_radix_sort(deepcopy(records)),
+                                 sorted(records, key=lambda r: r[0]))
+
+        inf = float('inf')
+        scores = [random.uniform(-1e6, 1e6) for i in range(3000)] + \
+            [0.0, -inf, inf, 1e-310, -1e-310]
+        self.assertListEqual(sort.float_radix_sort(deepcopy(scores)),
+                             sorted(scores))
+        for x in (-inf, -1.5, -1e-310, 0.0, 2.5, inf):
+            self.assertEqual(sort.key_to_float(sort.float_to_key(x)), x)
+
+    @unittest.skipIf(sort.numpy is None, 'numpy is not installed')
+    def test_vectorized(self):
+        import array
+        import numpy
+        ilist = [2, 4, 1, 9, 7, 5, 3, 2, 3, -8]
+        olist = sorted(ilist)
+        for func in (sort.counting_sort_vec, sort.radix_sort_vec):
+            self.assertListEqual(func(ilist), olist)  # list in, list out
+            result = func(array.array('l', ilist))
+            self.assertEqual(result.typecode, 'l')
+            self.assertListEqual(result.tolist(), olist)
+            result = func(numpy.array(ilist, dtype=numpy.int8))
+            self.assertEqual(result.dtype, numpy.int8)
+            self.assertListEqual(result.tolist(), olist)
+            self.assertListEqual(func([]), [])
+
+        saved = sort.RADIX_ARGSORT
+        try:
+            for sort.RADIX_ARGSORT in (True, False):  # digit passes or not
+                keys = numpy.random.randint(-2 ** 63, 2 ** 63 - 1,
+                                            size=10000)
+                self.assertTrue((sort.radix_sort_vec(keys) ==
+                                 numpy.sort(keys)).all())
+                keys = numpy.array([2 ** 64 - 1, 0, 2 ** 63],
+                                   dtype=numpy.uint64)
+                self.assertListEqual(sort.radix_sort_vec(keys).tolist(),
+                                     [0, 2 ** 63, 2 ** 64 - 1])
+                self.assertListEqual(sort.radix_sort_vec(ilist), olist)
+                self.assertRaises(TypeError, sort.radix_sort_vec, [1.5, 2.5])
+        finally:
+            sort.RADIX_ARGSORT = saved
+
+    def test_parallel_sort(self):
+        from parallel import parallel_sort, MIN_PARALLEL
+        array = [random.randint(-2 ** 40, 2 ** 40) for i in range(MIN_PARALLEL)]
+        self.assertListEqual(parallel_sort(array, workers=3), sorted(array))
+        array = [random.random() for i in range(MIN_PARALLEL)]
+        self.assertListEqual(parallel_sort(array, workers=2, typecode='d'),
+                             sorted(array))
+        self.assertListEqual(parallel_sort([3, 1, 2], workers=2), [1, 2, 3])
+        # typecode follows the keys
+        array = [random.random() * 10 for i in range(MIN_PARALLEL)]
+        self.assertListEqual(parallel_sort(array, workers=2), sorted(array))
+        self.assertRaises(ValueError, parallel_sort, array, 2, 'l')
+        self.assertRaises(TypeError, parallel_sort, ['a'] * MIN_PARALLEL, 2)
+        self.assertRaises(OverflowError, parallel_sort, [2 ** 64], 2)
+
+    def test_external_sort(self):
+        import os
+        import array
+        import shutil
+        import tempfile
+        from extsort import external_sort, merge_fanin, OVERHEAD
+        # 2 GB with 1 MB blocks: the expanded read buffers fit the budget
+        fanin = merge_fanin(2 << 30, 1 << 20)
+        self.assertEqual(fanin, (2 << 30) // ((1 << 20) * OVERHEAD) - 1)
+        self.assertTrue((fanin + 1) * (1 << 20) * OVERHEAD <= 2 << 30)
+        self.assertEqual(merge_fanin(4096, 1024), 2)
+        tmp = tempfile.mkdtemp()
+        try:
+            src, dst = os.path.join(tmp, 'src'), os.path.join(tmp, 'dst')
+            # tiny budget: many runs and more than one merge pass
+            lines = ['%d\n' % random.randint(0, 10 ** 6) for i in range(5000)]
+            with open(src, 'wb') as f:
+                f.writelines(lines)
+            nruns = external_sort(src, dst, memory=4096, block=512)
+            self.assertTrue(nruns > 7)
+            with open(dst, 'rb') as f:
+                self.assertListEqual(f.readlines(), sorted(lines))
+
+            keys = array.array('l', [random.randint(-2 ** 40, 2 ** 40)
+                                     for i in range(5000)])
+            with open(src, 'wb') as f:
+                keys.tofile(f)
+            external_sort(src, dst, memory=8192, typecode='l', block=1024)
+            result = array.array('l')
+            with open(dst, 'rb') as f:
+                result.fromstring(f.read())
+            self.assertListEqual(result.tolist(), sorted(keys))
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_bench(self):
+        import os
+        import bench
+        result = bench.run(['merge_sort', 'radix_sort'], ['zipf', 'sorted'],
+                           [100], repeat=2, out=None)
+        self.assertEqual(len(result['results']), 4)
+        cell = result['results'][0]
+        self.assertEqual(cell['algorithm'], 'merge_sort')
+        self.assertEqual(len(cell['runs']), 2)
+        self.assertTrue(cell['comparisons'] > 0)
+        self.assertEqual(result['results'][-1]['comparisons'], None)
+        if hasattr(os, 'fork'):
+            self.assertTrue(all(isinstance(c['peak_bytes'], int)
+                                for c in result['results']))
+            peak = bench.peak_memory(sort.merge_sort, range(200000, 0, -1))
+            self.assertTrue(peak > 0)
+        keys = bench.gen_zipf(5000)
+        self.assertTrue(1 <= min(keys) and max(keys) <= 5000)
+        # p(1) / p(2) = 2^s, s = 1.2
+        self.assertTrue(1.7 < keys.count(1) / float(keys.count(2)) < 3.0)
+
+        slower = deepcopy(result)
+        for cell in slower['results']:
+            cell['best'] *= 2
+        self.assertEqual(len(bench.compare(result, slower, 0.5)), 4)
+        self.assertListEqual(bench.compare(slower, result, 0.5), [])
+
     def test_runingtime(self):
         def record_time(func, array):
             start = time.time()
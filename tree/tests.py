@@ -104,3 +104,33 @@ class TestTree(unittest.TestCase):
             self.assertTrue(t.sanity())
             self.assertEqual(length, len(t.as_list()))
             self.assertFalse(t.find(key))  # key should gone
+
+    def test_static_index(self):
+        import bisect
+        from staticindex import StaticIndex
+        for n in (0, 1, 2, 7, 8, 100, 1000):
+            keys = sorted(random.randint(0, n) for i in range(n))
+            index = StaticIndex(keys)
+            self.assertTrue(index.sanity())
+            self.assertEqual(len(index), n)
+            self.assertListEqual(index.as_list(), keys)
+            queries = range(-1, n + 2)
+            for key in queries:
+                self.assertEqual(index.lower_bound(key),
+                                 bisect.bisect_left(keys, key))
+                self.assertEqual(index.upper_bound(key),
+                                 bisect.bisect_right(keys, key))
+                self.assertEqual(key in index, key in keys)
+            self.assertListEqual(index.lower_bounds(queries),
+                                 [bisect.bisect_left(keys, q)
+                                  for q in queries])
+            lo, hi = n // 4, n // 2
+            self.assertListEqual(list(index.range(lo, hi)),
+                                 [k for k in keys if lo <= k < hi])
+            self.assertEqual(index.count(lo, hi), len(index.range(lo, hi)))
+
+        index = StaticIndex([0.5, 1.5, 2.5], 'd')
+        self.assertEqual(index.lower_bound(1.0), 1)
+        self.assertEqual(index.find(2.5), 2.5)
+        self.assertEqual(index.find(2.0), None)
+        self.assertRaises(ValueError, StaticIndex, [2, 1])